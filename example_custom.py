@@ -19,8 +19,9 @@ custom_learner_step = CustomStep(
 )
 
 
-exp = SimpleExperiment("custom_example")
-exp.set_system("systems", system_params)
-exp.set_sampling("splc-sampling", sampling_params)
-exp.set_learning(custom=custom_learner_step)
-exp.execute()
+if __name__ == "__main__":
+    exp = SimpleExperiment("custom_example")
+    exp.set_system("systems", system_params)
+    exp.set_sampling("splc-sampling", sampling_params)
+    exp.set_learning(custom=custom_learner_step)
+    exp.execute()
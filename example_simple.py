@@ -13,8 +13,9 @@ learning_params = {
 }
 
 
-exp = SimpleExperiment("simple_example")
-exp.set_system("systems", system_params)
-exp.set_sampling("sklearn-sampling", sampling_params)
-exp.set_learning("decart", learning_params)
-exp.execute()
+if __name__ == "__main__":
+    exp = SimpleExperiment("simple_example")
+    exp.set_system("systems", system_params)
+    exp.set_sampling("sklearn-sampling", sampling_params)
+    exp.set_learning("decart", learning_params)
+    exp.execute()
@@ -2,5 +2,6 @@ import pandas as pd
 from executor.parsing import Executor
 
 
-exp = Executor("configs/examples/exmpl_simple.yaml")
-exp.execute()
+if __name__ == "__main__":
+    exp = Executor("configs/examples/exmpl_simple.yaml")
+    exp.execute()
@@ -0,0 +1,311 @@
+"""
+Backends that execute the entry points of steps.
+"""
+import os
+import sys
+import json
+import shlex
+import atexit
+import logging
+import tempfile
+import importlib
+import threading
+import multiprocessing
+from urllib.parse import urlparse
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+import click
+import mlflow
+import mlflow.projects
+import mlflow.artifacts
+from mlflow.entities import Param
+from mlflow.tracking import MlflowClient
+from rich.logging import RichHandler
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="BACKEND    %(message)s",
+    handlers=[RichHandler()],
+)
+
+# limit of params in a single MlflowClient.log_batch request
+MAX_PARAMS_PER_BATCH = 100
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def _load_entry_point(path: str, entry_point: str):
+    mlproject = os.path.join(path, "MLproject")
+    if not os.path.isfile(mlproject):
+        return None
+    with open(mlproject, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)["entry_points"].get(entry_point)
+
+
+def _param_type(param) -> str:
+    if isinstance(param, dict):
+        return param.get("type", "string")
+    return param
+
+
+def _resolve_value(name: str, param_type: str, value):
+    """
+    Resolves path and uri parameters like mlflow projects do. Local paths
+    become absolute, as workers do not share the working directory, and
+    remote paths are downloaded.
+    """
+    if param_type == "uri":
+        if not urlparse(str(value)).scheme:
+            raise ValueError(f"Expected URI for parameter {name} but got {value}")
+    elif param_type == "path":
+        parsed = urlparse(str(value))
+        if parsed.scheme not in ("", "file"):
+            return mlflow.artifacts.download_artifacts(
+                artifact_uri=str(value), dst_path=tempfile.mkdtemp(prefix="pim-param-")
+            )
+        local_path = parsed.path if parsed.scheme else str(value)
+        if not os.path.exists(local_path):
+            raise ValueError(
+                f"Got value {value} for parameter {name}, "
+                "but no such file or directory was found."
+            )
+        return os.path.abspath(local_path)
+    return value
+
+
+def _render_command(spec: dict, params: dict):
+    """
+    Renders the command of an entry point like mlflow projects do and
+    returns the arguments passed to the script.
+    """
+    values = {}
+    for name, param in spec.get("parameters", {}).items():
+        if isinstance(param, dict) and "default" in param:
+            values[name] = param["default"]
+    values.update(params)
+    for name, param in spec.get("parameters", {}).items():
+        if name in values:
+            values[name] = _resolve_value(name, _param_type(param), values[name])
+
+    command = spec["command"].format(
+        **{k: shlex.quote(str(v)) for k, v in values.items()}
+    )
+    extra = [
+        f"--{k}={v}" for k, v in params.items() if k not in spec.get("parameters", {})
+    ]
+    return shlex.split(command) + extra
+
+
+def _is_python_command(spec: dict):
+    command = shlex.split(spec["command"])
+    return len(command) > 1 and command[0] == "python" and command[1].endswith(".py")
+
+
+def _find_command(module):
+    for attribute in vars(module).values():
+        if isinstance(attribute, click.Command):
+            return attribute
+    raise ValueError(f"Module {module.__name__} does not provide a click command.")
+
+
+def _init_worker(path: str):
+    sys.path.insert(0, path)
+    os.chdir(tempfile.mkdtemp(prefix="pim-worker-"))
+
+
+def _run_entry_point(
+    path: str, entry_point: str, experiment_id: str, params: dict, args: list
+) -> str:
+    module = importlib.import_module(os.path.splitext(args[1])[0])
+    command = _find_command(module)
+
+    client = MlflowClient()
+    run = client.create_run(
+        experiment_id,
+        tags={
+            "mlflow.source.name": path,
+            "mlflow.project.entryPoint": entry_point,
+            "mlflow.project.backend": "process",
+        },
+    )
+    run_id = run.info.run_id
+    logged = [Param(name, str(value)) for name, value in params.items()]
+    for i in range(0, len(logged), MAX_PARAMS_PER_BATCH):
+        client.log_batch(run_id, params=logged[i : i + MAX_PARAMS_PER_BATCH])
+
+    # like mlflow projects, so nested runs and searches use the experiment
+    os.environ["MLFLOW_RUN_ID"] = run_id
+    os.environ["MLFLOW_EXPERIMENT_ID"] = experiment_id
+    try:
+        command.main(args=args[2:], standalone_mode=False)
+    except BaseException as excpt:
+        client.set_terminated(run_id, status="FAILED")
+        raise RuntimeError(
+            f"Entry point {entry_point} of {path} failed: {excpt!r}"
+        ) from None
+    finally:
+        os.environ.pop("MLFLOW_RUN_ID", None)
+        os.environ.pop("MLFLOW_EXPERIMENT_ID", None)
+        while mlflow.active_run():
+            mlflow.end_run()
+
+    client.set_terminated(run_id)
+    return run_id
+
+
+class MlflowProjectBackend:
+    """
+    Executes steps as mlflow projects, i.e. in their docker or conda environment.
+
+    ...
+
+    Attributes
+    ----------
+    backend : str
+        the mlflow backend, e.g. local or kubernetes
+    backend_config : dict
+        configuration passed to the mlflow backend
+    """
+
+    def __init__(self, backend: str = None, backend_config: dict = None):
+        self.backend = backend if backend else "local"
+        self.backend_config = backend_config
+
+    def run(self, path: str, entry_point: str, experiment_name: str, params: dict):
+        """
+        Executes the entry point and returns the run id.
+        """
+        return mlflow.projects.run(
+            path,
+            entry_point=entry_point,
+            experiment_name=experiment_name,
+            parameters=params,
+            backend=self.backend,
+            backend_config=self.backend_config,
+        ).run_id
+
+    def shutdown(self):
+        """
+        Nothing to release, every run starts its own process.
+        """
+
+
+class ProcessPoolBackend:
+    """
+    Executes python entry points of local steps in warm worker processes.
+    Workers keep their imports (sklearn, pandas, ...) between steps and no
+    container or conda environment is started, so the dependencies of the
+    steps need to be installed in the current environment.
+    Steps that are no local python projects are executed as mlflow projects.
+
+    ...
+
+    Attributes
+    ----------
+    max_workers : int
+        maximal number of steps executed at the same time
+    """
+
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers if max_workers else os.cpu_count()
+        self._pools = {}
+        self._experiments = {}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+        self._fallback = MlflowProjectBackend()
+
+    def _pool(self, path: str):
+        with self._lock:
+            if path not in self._pools:
+                # one pool per project, modules of different steps share names.
+                # Workers are spawned, as forking the multithreaded executor
+                # can copy locks held by other threads.
+                self._pools[path] = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(path,),
+                )
+            return self._pools[path]
+
+    def _experiment_id(self, experiment_name: str):
+        with self._lock:
+            if experiment_name not in self._experiments:
+                client = MlflowClient()
+                experiment = client.get_experiment_by_name(experiment_name)
+                self._experiments[experiment_name] = (
+                    experiment.experiment_id
+                    if experiment
+                    else client.create_experiment(experiment_name)
+                )
+            return self._experiments[experiment_name]
+
+    def run(self, path: str, entry_point: str, experiment_name: str, params: dict):
+        """
+        Executes the entry point and returns the run id.
+        """
+        path = os.path.abspath(path) if os.path.isdir(path) else path
+        spec = _load_entry_point(path, entry_point) if os.path.isdir(path) else None
+        if not spec or not _is_python_command(spec):
+            logging.info("Execute %s of %s as mlflow project.", entry_point, path)
+            return self._fallback.run(path, entry_point, experiment_name, params)
+
+        # paths are resolved in the working directory of the executor
+        args = _render_command(spec, params)
+        experiment_id = self._experiment_id(experiment_name)
+        with self._slots:
+            return (
+                self._pool(path)
+                .submit(
+                    _run_entry_point, path, entry_point, experiment_id, params, args
+                )
+                .result()
+            )
+
+    def shutdown(self):
+        """
+        Shuts down all worker processes.
+        """
+        with self._lock:
+            for pool in self._pools.values():
+                pool.shutdown()
+            self._pools = {}
+
+
+def get_backend(backend: str = None, backend_config: dict = None):
+    """
+    Returns a shared instance of the requested backend.
+
+    Parameters
+    ----------
+    backend : str
+        name of the backend, defaults to local mlflow project execution
+    backend_config : dict
+        configuration of the backend
+    """
+    backend = backend if backend else "local"
+    key = (backend, json.dumps(backend_config, sort_keys=True))
+    with _backends_lock:
+        if key not in _backends:
+            if backend == "process":
+                _backends[key] = ProcessPoolBackend(
+                    **(backend_config if backend_config else {})
+                )
+            else:
+                _backends[key] = MlflowProjectBackend(backend, backend_config)
+        return _backends[key]
+
+
+@atexit.register
+def shutdown_backends():
+    """
+    Shuts down all shared backends, e.g. the worker processes of the process
+    backend. Backends requested afterwards are created again.
+    """
+    with _backends_lock:
+        backends = list(_backends.values())
+        _backends.clear()
+    for backend in backends:
+        backend.shutdown()
@@ -1,15 +1,17 @@
 import logging
 import sys
 import json
+import time
 from abc import ABC
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 import mlflow
+from mlflow.entities import Metric, Param
 from mlflow.tracking import MlflowClient
 
 from rich.logging import RichHandler
 
-from executor.steps import Step, StepFactory
+from executor.steps import Step, StepFactory, BatchEvaluationStep
 
 logging.basicConfig(
     level=logging.INFO,
@@ -17,27 +19,54 @@ logging.basicConfig(
     handlers=[RichHandler()],
 )
 
+# limits of a single MlflowClient.log_batch request
+MAX_PARAMS_PER_BATCH = 100
+MAX_ENTITIES_PER_BATCH = 1000
 
-def _load_params_and_metrics(run_id):
-    run = mlflow.get_run(run_id)
-    return run.data.params, run.data.metrics
 
+def _load_runs(run_ids, client):
+    """loads multiple runs with a single query"""
+    experiment_ids = [exp.experiment_id for exp in client.search_experiments()]
+    id_list = ", ".join(f"'{idx}'" for idx in set(run_ids))
+    runs = client.search_runs(
+        experiment_ids,
+        filter_string=f"attributes.run_id IN ({id_list})",
+        max_results=len(run_ids),
+    )
+    return {run.info.run_id: run for run in runs}
 
-def _update_run_data(experiment_id, sub_run_id, sub_run_name, client):
-    params, metrics = _load_params_and_metrics(sub_run_id)
-    params = {f"{sub_run_name}.{k}": v for k, v in params.items()}
-    metrics = {f"{sub_run_name}.{k}": v for k, v in metrics.items()}
 
-    for k, v in metrics.items():
-        client.log_metric(experiment_id, k, v)
-    for k, v in params.items():
-        client.log_param(experiment_id, k, v)
+def _batches(metrics, params):
+    while metrics or params:
+        batch_params = params[:MAX_PARAMS_PER_BATCH]
+        batch_metrics = metrics[: MAX_ENTITIES_PER_BATCH - len(batch_params)]
+        params = params[len(batch_params) :]
+        metrics = metrics[len(batch_metrics) :]
+        yield batch_metrics, batch_params
 
 
 def _update_exp_params_and_metrics(ids, client):
-    steps = [step.replace("run_id", "") for step in ids if step != "experiment"]
-    for step in steps:
-        _update_run_data(ids["experiment"], ids[step], step, client)
+    steps = {
+        step.replace("run_id", ""): run_id
+        for step, run_id in ids.items()
+        if step != "experiment"
+    }
+    runs = _load_runs(list(steps.values()), client)
+
+    timestamp = int(time.time() * 1000)
+    metrics, params = [], []
+    for step, run_id in steps.items():
+        if run_id not in runs:
+            logging.warning("Could not find run %s of step %s.", run_id, step)
+            continue
+        data = runs[run_id].data
+        metrics += [
+            Metric(f"{step}.{k}", v, timestamp, 0) for k, v in data.metrics.items()
+        ]
+        params += [Param(f"{step}.{k}", v) for k, v in data.params.items()]
+
+    for batch_metrics, batch_params in _batches(metrics, params):
+        client.log_batch(ids["experiment"], metrics=batch_metrics, params=batch_params)
 
 
 class Experiment(ABC):
@@ -67,6 +96,17 @@ class Experiment(ABC):
 
 
 class SimpleExperiment(Experiment):
+    def _run_step(self, step_name, backend=None, backend_config=None):
+        """runs a step and returns the single run holding its result"""
+        step = self.steps[step_name]
+        run_ids = step.result_run_ids(step.run(backend, backend_config))
+        if len(run_ids) != 1:
+            raise ValueError(
+                f"The {step_name} step produced {len(run_ids)} results, "
+                "a SimpleExperiment supports one. Use a MultiStepExperiment."
+            )
+        return run_ids[0]
+
     def set_sampling(self, source=None, params: dict = None, custom: Step = None):
         """specify sampling step"""
         self.steps["sampling"] = custom if custom else StepFactory(source, params)
@@ -94,16 +134,17 @@ class SimpleExperiment(Experiment):
         ids["experiment"] = run.info.run_id
 
         try:
-            ids["system"] = self.steps["system"].run()
+            ids["system"] = self._run_step("system", backend, backend_config)
 
             self.steps["sampling"].params["system_run_id"] = ids["system"]
-            ids["sampling"] = self.steps["sampling"].run()
+            # batch sampling holds its sample in a nested run
+            ids["sampling"] = self._run_step("sampling", backend, backend_config)
 
             self.steps["learning"].params["sampling_run_id"] = ids["sampling"]
-            ids["learning"] = self.steps["learning"].run()
+            ids["learning"] = self._run_step("learning", backend, backend_config)
 
             self.steps["evaluation"].params["learning_run_id"] = ids["learning"]
-            ids["evaluation"] = self.steps["evaluation"].run()
+            ids["evaluation"] = self._run_step("evaluation", backend, backend_config)
             self.client.set_terminated(run.info.run_id)
             _update_exp_params_and_metrics(ids, self.client)
 
@@ -123,6 +164,10 @@ class SimpleExperiment(Experiment):
 
 
 class MultiStepExperiment(Experiment):
+    def __init__(self, experiment_name: str = None, threads: int = 2):
+        super().__init__(experiment_name)
+        self.threads = threads
+
     def _generate_step_list(self, steps: list):
         return [StepFactory(step_info[0], step_info[1]) for step_info in steps]
 
@@ -147,35 +192,86 @@ class MultiStepExperiment(Experiment):
                 "Running a simple workflow as multistep. Consider using SimpleWorkflow class."
             )
 
-    def _execute_multiple_steps(self, step_name, threads=2):
-
-        with ThreadPoolExecutor(max_workers=threads) as executor:
-            run_ids = executor.map(lambda step: step.run(), self.steps[step_name])
-
-        return [idx for idx in run_ids]
-
     def _generate_sampling_steps(self, system_run_id):
 
         for step in self.steps["sampling"]:
             step.params["system_run_id"] = system_run_id
 
-    def _generate_evaluation_steps(self, learning_runs):
-        self.steps["evaluation"] = []
-        for idx in learning_runs:
-            step = StepFactory("evaluation")
-            step.params["learning_run_id"] = idx
-            self.steps["evaluation"].append(step)
+    def _generate_evaluation_steps(self, learning_run_id):
+        step = StepFactory("evaluation")
+        step.params["learning_run_id"] = learning_run_id
+        return [step]
 
-    def _generate_learning_steps(self, sampling_runs):
+    def _generate_learning_steps(self, sampling_run_id, learning_templates):
         new_steps = []
 
-        for step in self.steps["learning"]:
-            for idx in sampling_runs:
-                new_step = step.deepcopy()
-                new_step.params["sampling_run_id"] = idx
-                new_steps.append(new_step)
-
-        self.steps["learning"] = new_steps
+        for step in learning_templates:
+            new_step = step.deepcopy()
+            new_step.params["sampling_run_id"] = sampling_run_id
+            new_steps.append(new_step)
+
+        return new_steps
+
+    def _execute_batch_evaluation(self, ids, step, backend=None, backend_config=None):
+        """
+        Evaluates all learning runs in a single step. The list of runs is
+        logged to the workflow run, as it exceeds the length of a parameter.
+        """
+        self.client.log_dict(ids["workflow"], ids["learning"], "learning_runs.json")
+        step.params["run_list_id"] = ids["workflow"]
+        step.learning_run_ids = list(ids["learning"])
+        self.steps["evaluation"] = [step]
+        ids["evaluation"] = [step.run(backend, backend_config)]
+
+    def _execute_step_graph(self, ids, backend=None, backend_config=None):
+        """
+        Executes sampling, learning and evaluation steps as a dependency graph.
+        Child steps are submitted as soon as their parent run finished.
+        Returns whether all steps finished successfully.
+        """
+        learning_templates = self.steps["learning"]
+        children = {
+            "sampling": (
+                "learning",
+                lambda run_id: self._generate_learning_steps(run_id, learning_templates),
+            ),
+        }
+        if not isinstance(self.steps["evaluation"], BatchEvaluationStep):
+            children["learning"] = ("evaluation", self._generate_evaluation_steps)
+        self.steps["learning"] = []
+        self.steps["evaluation"] = []
+        succeeded = True
+
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            pending = {
+                executor.submit(step.run, backend, backend_config): ("sampling", step)
+                for step in self.steps["sampling"]
+            }
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step_name, step = pending.pop(future)
+                    try:
+                        run_ids = step.result_run_ids(future.result())
+                    except Exception as excpt:
+                        logging.error("A %s step failed: %s", step_name, excpt)
+                        succeeded = False
+                        continue
+
+                    ids[step_name] += run_ids
+                    if step_name not in children:
+                        continue
+
+                    child_name, generate_steps = children[step_name]
+                    for run_id in run_ids:
+                        for child in generate_steps(run_id):
+                            self.steps[child_name].append(child)
+                            future = executor.submit(
+                                child.run, backend, backend_config
+                            )
+                            pending[future] = (child_name, child)
+
+        return succeeded
 
     def execute(self, backend=None, backend_config=None):
         """execute specified steps"""
@@ -193,21 +289,26 @@ class MultiStepExperiment(Experiment):
             exp_id = self.client.create_experiment(self.experiment_name)
 
         run = self.client.create_run(exp_id)
-        ids = {}
+        ids = {"sampling": [], "learning": [], "evaluation": []}
 
         # run system run
         ids["workflow"] = run.info.run_id
-        ids["system"] = self.steps["system"].run()
+        ids["system"] = self.steps["system"].run(backend, backend_config)
 
-        # run first possible multistep workflow
+        # run sampling, learning and evaluation as soon as their inputs exist
+        evaluation = self.steps["evaluation"]
         self._generate_sampling_steps(ids["system"])
-        ids["sampling"] = self._execute_multiple_steps("sampling")
+        succeeded = self._execute_step_graph(ids, backend, backend_config)
 
-        self._generate_learning_steps(ids["sampling"])
-        ids["learning"] = self._execute_multiple_steps("learning")
+        if isinstance(evaluation, BatchEvaluationStep) and ids["learning"]:
+            try:
+                self._execute_batch_evaluation(ids, evaluation, backend, backend_config)
+            except Exception as excpt:
+                logging.error("The batch evaluation failed: %s", excpt)
+                succeeded = False
 
-        self._generate_evaluation_steps(ids["learning"])
-        ids["evaluation"] = self._execute_multiple_steps("evaluation")
-        self.client.set_terminated(run.info.run_id)
+        self.client.set_terminated(
+            run.info.run_id, status="FINISHED" if succeeded else "FAILED"
+        )
 
         return ids
@@ -7,8 +7,10 @@ import sys
 from collections import Counter
 from concurrent.futures import ThreadPoolExecutor
 import mlflow
+from mlflow.tracking import MlflowClient
 from executor.experiment import SimpleExperiment, MultiStepExperiment
 from executor.steps import StepFactory
+from executor.backends import shutdown_backends
 import pandas as pd
 
 logging.basicConfig(
@@ -18,6 +20,9 @@ logging.basicConfig(
 )
 
 STEPS = ["system", "sampling", "learning", "evaluation"]
+RESULT_STEPS = ["experiment", "sampling", "learning"]
+RUNS_PER_QUERY = 100
+COLLECTION_THREADS = 8
 
 
 def _extract_steps(content):
@@ -111,9 +116,7 @@ def _substitute_stepwise_params(parameters, experiment):
 
     return experiments
 
-def _load_run_infos(run_id, entrypoint=None):
-    run = mlflow.get_run(run_id)
-
+def _run_infos(run, entrypoint=None):
     data = {}
     data.update(run.info)
     data.update(run.data.tags)
@@ -128,6 +131,26 @@ def _load_run_infos(run_id, entrypoint=None):
     return data
 
 
+def _load_run_infos(run_id, entrypoint=None):
+    return _run_infos(mlflow.get_run(run_id), entrypoint)
+
+
+def _search_runs(run_ids, experiment_ids, client):
+    id_list = ", ".join(f"'{idx}'" for idx in run_ids)
+    runs, page_token = [], None
+    while True:
+        page = client.search_runs(
+            experiment_ids,
+            filter_string=f"attributes.run_id IN ({id_list})",
+            max_results=RUNS_PER_QUERY,
+            page_token=page_token,
+        )
+        runs += list(page)
+        page_token = page.token
+        if not page_token:
+            return runs
+
+
 def _load_data(run_ids, repetition):
     full_data = _load_run_infos(run_ids["system"], "system")
     full_data.update(_load_run_infos(run_ids["sampling"], "sampling"))
@@ -184,7 +207,10 @@ class Executor:
         self.exp_data = []
         self.sampling_data = []
         self.learning_data = []
+        self.results = pd.DataFrame()
         self.config, self.experiment = self._load_config(config_file)
+        self._client = MlflowClient()
+        self._runs = {}
         
 
     def _log_run_information(self):
@@ -203,6 +229,13 @@ class Executor:
 
         return exp_config, step_config
 
+    def _backend(self):
+        backend = self.config.get("backend")
+        backend_config = self.config.get("backend_config")
+        if backend == "process" and not backend_config:
+            backend_config = {"max_workers": self.config["threads"]}
+        return backend, backend_config
+
     def _load_experiments(self):
 
         for r in range(1, self.config["repetitions"] + 1):
@@ -221,18 +254,22 @@ class Executor:
             logging.info("Start repetition %i of %i", r, self.config["repetitions"])
             executed_runs = []
 
+            backend, backend_config = self._backend()
+
             if r == 1:
-                executed_runs.append(exps[0].execute())
+                executed_runs.append(exps[0].execute(backend, backend_config))
                 exps = exps[1:]
 
             
 
             if self.config["threads"] == 1:
                 for e in exps:
-                    executed_runs.append(e.execute())
+                    executed_runs.append(e.execute(backend, backend_config))
             else:
                 with ThreadPoolExecutor(max_workers=self.config["threads"]) as executor:
-                    ids = executor.map(lambda exp: exp.execute(), exps)
+                    ids = executor.map(
+                        lambda exp: exp.execute(backend, backend_config), exps
+                    )
                     executed_runs += [x for x in ids]
 
             self.run_ids[r] = executed_runs
@@ -243,17 +280,60 @@ class Executor:
     def execute(self):
         self._load_experiments()
         self._log_run_information()
-        self._execute_experiments()
+        try:
+            self._execute_experiments()
+        finally:
+            # releases the worker processes of the process backend
+            shutdown_backends()
         self._load_experiment_data()
 
+    def _fetch_new_runs(self, run_ids):
+        new_ids = [idx for idx in set(run_ids) if idx not in self._runs]
+        if not new_ids:
+            return
+
+        experiment_ids = [
+            exp.experiment_id for exp in self._client.search_experiments()
+        ]
+        chunks = [
+            new_ids[i : i + RUNS_PER_QUERY]
+            for i in range(0, len(new_ids), RUNS_PER_QUERY)
+        ]
+        with ThreadPoolExecutor(max_workers=COLLECTION_THREADS) as executor:
+            for runs in executor.map(
+                lambda chunk: _search_runs(chunk, experiment_ids, self._client),
+                chunks,
+            ):
+                self._runs.update({run.info.run_id: run for run in runs})
+
     def _load_experiment_data(self):
+        finished = [
+            (repetition, run)
+            for repetition, runs in self.run_ids.items()
+            for run in runs
+            if all(step in run for step in RESULT_STEPS)
+        ]
+        self._fetch_new_runs([run[step] for _, run in finished for step in RESULT_STEPS])
+
         self.exp_data = []
         self.sampling_data = []
         self.learning_data = []
-        for _, runs in self.run_ids.items():
-            for run in runs:
-                if "experiment" in run and "sampling" in run and "learning" in run:
-                    self.exp_data.append(_load_run_infos(run["experiment"]))
-                    self.sampling_data.append(_load_run_infos(run["sampling"]))
-                    self.learning_data.append(_load_run_infos(run["learning"]))
-    
\ No newline at end of file
+        rows = []
+        for repetition, run in finished:
+            if not all(run[step] in self._runs for step in RESULT_STEPS):
+                logging.warning("Could not load runs of experiment %s", run["experiment"])
+                continue
+            experiment, sampling, learning = (
+                self._runs[run[step]] for step in RESULT_STEPS
+            )
+            self.exp_data.append(_run_infos(experiment))
+            self.sampling_data.append(_run_infos(sampling))
+            self.learning_data.append(_run_infos(learning))
+
+            row = {"repetition": repetition}
+            row.update(_run_infos(experiment, "experiment"))
+            row.update(_run_infos(sampling, "sampling"))
+            row.update(_run_infos(learning, "learning"))
+            rows.append(row)
+
+        self.results = pd.DataFrame(rows)
@@ -1,10 +1,15 @@
 import os
+import json
+import hashlib
+import threading
 import yaml
 import logging
 
 from rich.logging import RichHandler
 import mlflow
-import mlflow.projects
+from mlflow.tracking import MlflowClient
+
+from executor.backends import get_backend
 
 logging.basicConfig(
     level=logging.INFO,
@@ -12,6 +17,25 @@ logging.basicConfig(
     handlers=[RichHandler()],
 )
 
+STEP_KEY_TAG = "step_key"
+
+# params that do not influence the result of a step
+_VOLATILE_PARAMS = ["logs_to_artifact"]
+
+_step_index = {}
+_step_index_lock = threading.Lock()
+
+# input files of systems and the parameters their checksums are logged as
+SYSTEM_INPUT_FILES = {
+    "fm.xml": "fm_sha256",
+    "measurements.xml": "measurements_sha256",
+    "meta.yaml": "meta_sha256",
+}
+# version of system imports, as logged by executor/steps/systems/load_system.py
+SYSTEM_IMPORT_VERSION = {"import_version": "2"}
+
+_checksums = {}
+
 
 def _generate_filter_string(params: dict):
     clauses = [
@@ -23,46 +47,142 @@ def _generate_filter_string(params: dict):
     return query
 
 
-def get_system_if_exists(name):
+def _file_checksum(filename: str) -> str:
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+    if key not in _checksums:
+        checksum = hashlib.sha256()
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(1024**2), b""):
+                checksum.update(chunk)
+        _checksums[key] = checksum.hexdigest()
+    return _checksums[key]
+
+
+def get_system_if_exists(name, checksums: dict = None):
     """
-    Returns a run if one exists.
+    Returns the latest run of a system if one exists.
 
     Parameters
     ----------
-    parameters : dict[str, any]
-        the parameters that the run should contain
+    name : str
+        the name of the system
+    checksums : dict[str, str]
+        checksum parameters of input files the run should contain
     """
 
     filter_string = f"parameter.system = '{name}' AND attribute.status = 'FINISHED'"
+    for param, checksum in (checksums if checksums else {}).items():
+        filter_string += f" AND parameter.{param} = '{checksum}'"
     runs = mlflow.search_runs(experiment_names=["systems"], filter_string=filter_string)
     return runs["run_id"][0] if not runs.empty else False
 
 
+def generate_step_key(path: str, entry_point: str, params: dict = None):
+    """
+    Returns a content-addressed key identifying the result of a step.
+
+    Parameters
+    ----------
+    path : str
+        path or uri of the mlflow project
+    entry_point : str
+        entry point of the mlflow project
+    params : dict[str, any]
+        parameters of the step, including the run ids of upstream steps
+    """
+    params = {
+        str(k): str(v)
+        for k, v in (params if params else {}).items()
+        if k not in _VOLATILE_PARAMS
+    }
+    upstream = {k: v for k, v in params.items() if k.endswith("_run_id")}
+    content = {
+        "path": path.rstrip("/"),
+        "entry_point": entry_point,
+        "params": hashlib.sha256(
+            json.dumps(
+                {k: v for k, v in params.items() if k not in upstream},
+                sort_keys=True,
+            ).encode("utf-8")
+        ).hexdigest(),
+        "upstream": upstream,
+    }
+    return hashlib.sha256(
+        json.dumps(content, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def get_step_if_exists(experiment_name: str, step_key: str):
+    """
+    Returns the id of a finished run with the given step key if one exists.
+
+    Parameters
+    ----------
+    experiment_name : str
+        the experiment the run belongs to
+    step_key : str
+        the key generated by generate_step_key
+    """
+    with _step_index_lock:
+        if step_key in _step_index:
+            return _step_index[step_key]
+
+    filter_string = (
+        f"tags.{STEP_KEY_TAG} = '{step_key}' AND attribute.status = 'FINISHED'"
+    )
+    runs = mlflow.search_runs(
+        experiment_names=[experiment_name], filter_string=filter_string
+    )
+    if runs.empty:
+        return False
+
+    with _step_index_lock:
+        _step_index[step_key] = runs["run_id"][0]
+    return runs["run_id"][0]
+
+
+def _register_step(run_id: str, step_key: str):
+    MlflowClient().set_tag(run_id, STEP_KEY_TAG, step_key)
+    with _step_index_lock:
+        _step_index[step_key] = run_id
+
+
 class Step:
     path: str = None
     run_id: str = None
     entry_point: str = None
     params: dict = None
     experiment_name: str = None
+    cacheable: bool = False
 
     @classmethod
     def from_run_id(cls, run_id):
         """create step object from an existing run_id"""
         return cls(None, None, None, run_id)
 
-    def run(self):
+    def run(self, backend: str = None, backend_config: dict = None):
         """either runs specified project or returns existing run"""
 
+        step_key = None
+        if not self.run_id and self.cacheable:
+            step_key = generate_step_key(
+                self.path, self.entry_point, self._key_params()
+            )
+            self.run_id = get_step_if_exists(self.experiment_name, step_key)
+
         retries = 0
         while retries < 3:
             try:
                 if not self.run_id:
-                    self.run_id = mlflow.projects.run(
+                    self.run_id = get_backend(backend, backend_config).run(
                         self.path,
-                        entry_point=self.entry_point,
-                        experiment_name=self.experiment_name,
-                        parameters=self.params,
-                    ).run_id
+                        self.entry_point,
+                        self.experiment_name,
+                        self.params,
+                    )
+                    if step_key:
+                        _register_step(self.run_id, step_key)
                 else:
                     logging.warning(
                         "Use existing run %s in entrypoint %s",
@@ -79,12 +199,21 @@ class Step:
                 retries += 1
         raise Exception("Could not execute step %s", self.entry_point)
 
+    def _key_params(self):
+        """returns the params that identify the result of the step"""
+        return self.params
+
+    def result_run_ids(self, run_id: str):
+        """returns the runs that hold the results of an executed step"""
+        return [run_id]
+
     def deepcopy(self):
         copy = Step()
         copy.path = self.path
         copy.run_id = self.run_id
         copy.entry_point = self.entry_point
         copy.experiment_name = self.experiment_name
+        copy.cacheable = self.cacheable
         copy.params = self.params.copy()
         return copy
 
@@ -97,23 +226,27 @@ class CustomStep(Step):
         params: dict = None,
         run_id=None,
         experiment_name: str = "custom",
+        cacheable: bool = False,
     ):
         self.path = path
         self.entry_point = entry_point
         self.experiment_name = experiment_name
         self.params = params if params else {}
         self.run_id = run_id
+        self.cacheable = cacheable
 
 
 class NonExecutingStep(Step):
     def __init__(self, run_id):
         self.run_id = run_id
 
-    def run(self):
+    def run(self, backend: str = None, backend_config: dict = None):
         return self.run_id
 
 
 class SplcSamplingStep(Step):
+    cacheable = True
+
     def __init__(self, params: dict = None):
         self.path = "executor/steps/SPLConqueror"
         self.entry_point = "sampling"
@@ -137,6 +270,24 @@ class SklearnSamplingStep(Step):
         self.params = params if params else {}
 
 
+class BatchSamplingStep(Step):
+    cacheable = True
+
+    def __init__(self, params: dict = None):
+        self.path = "executor/steps/scikit-learn/"
+        self.entry_point = "batch_sampling"
+        self.experiment_name = "sklearn-sampling"
+        self.params = params if params else {}
+
+    def result_run_ids(self, run_id: str):
+        """returns the nested runs holding one sample each"""
+        runs = mlflow.search_runs(
+            experiment_names=[self.experiment_name],
+            filter_string=f"tags.mlflow.parentRunId = '{run_id}'",
+        )
+        return list(runs["run_id"]) if not runs.empty else []
+
+
 class ScikitLearnerStep(Step):
     def __init__(self, params: dict = None):
         self.path = "executor/steps/scikit-learn/"
@@ -161,7 +312,17 @@ class DeepperfLearnerStep(Step):
         self.params = params if params else {}
 
 
+class DeepperfReplicationStep(Step):
+    def __init__(self, params: dict = None):
+        self.path = "executor/steps/deepperf-replication"
+        self.entry_point = "learning"
+        self.experiment_name = "deepperf-replication"
+        self.params = params if params else {}
+
+
 class DefaultEvaluationStep(Step):
+    cacheable = True
+
     def __init__(self, params: dict = None):
         self.path = "executor/steps/evaluation"
         self.entry_point = "evaluation"
@@ -169,15 +330,50 @@ class DefaultEvaluationStep(Step):
         self.params = params if params else {}
 
 
+class BatchEvaluationStep(Step):
+    cacheable = True
+
+    def __init__(self, params: dict = None):
+        self.path = "executor/steps/evaluation"
+        self.entry_point = "batch_evaluation"
+        self.experiment_name = "evaluation"
+        self.params = params if params else {}
+        # learning runs listed by the run_list_id run, set by the experiment
+        self.learning_run_ids = []
+
+    def _key_params(self):
+        """
+        identifies the result by the evaluated learning runs, as the run
+        listing them is new for every workflow
+        """
+        params = {k: v for k, v in self.params.items() if k != "run_list_id"}
+        params["learning_runs"] = hashlib.sha256(
+            ",".join(sorted(self.learning_run_ids)).encode("utf-8")
+        ).hexdigest()
+        return params
+
+
 class SystemLoadingStep(Step):
     def __init__(self, params: dict = None):
-        self.run_id = get_system_if_exists(
-            self._load_name(os.path.join(params["data_dir"]))
-        )
+        data_dir = params["data_dir"]
+        name = self._load_name(data_dir)
+        checksums = {
+            param: _file_checksum(os.path.join(data_dir, filename))
+            for filename, param in SYSTEM_INPUT_FILES.items()
+        } | SYSTEM_IMPORT_VERSION
+        self.run_id = get_system_if_exists(name, checksums)
         self.path = "executor/steps/systems/"
         self.entry_point = "systems"
         self.experiment_name = "systems"
-        self.params = params if params else {}
+        self.params = dict(params)
+
+        if not self.run_id:
+            previous_run_id = get_system_if_exists(name)
+            if previous_run_id:
+                logging.info(
+                    "Input files of %s changed since run %s", name, previous_run_id
+                )
+                self.params["previous_run_id"] = previous_run_id
 
     def _load_name(self, data_dir):
         with open(os.path.join(data_dir, "meta.yaml"), "r", encoding="utf-8") as f:
@@ -188,11 +384,14 @@ def StepFactory(source, params=None):
     sources = {
         "sklearn-learning": ScikitLearnerStep,
         "sklearn-sampling": SklearnSamplingStep,
+        "sklearn-batch-sampling": BatchSamplingStep,
         "splc-sampling": SplcSamplingStep,
         "splc-learning": SplcLearningStep,
         "decart": DecartLearnerStep,
         "deepperf": DeepperfLearnerStep,
+        "deepperf-replication": DeepperfReplicationStep,
         "evaluation": DefaultEvaluationStep,
+        "batch-evaluation": BatchEvaluationStep,
         "systems": SystemLoadingStep,
         "existing": NonExecutingStep,
     }
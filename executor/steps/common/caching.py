@@ -0,0 +1,433 @@
+import os
+import json
+import uuid
+import shutil
+import fcntl
+import logging
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import pyarrow.feather as feather
+import time
+from mlflow.artifacts import download_artifacts
+
+CACHE_DIR_ENV = "PIM_CACHE_DIR"
+CACHE_SIZE_ENV = "PIM_CACHE_SIZE_MB"
+# the docker based steps mount the same default, see their MLproject files
+DEFAULT_CACHE_DIR = "/tmp/pim-cache"
+DEFAULT_CACHE_SIZE_MB = 10240
+# temporary files of processes that did not finish are removed after a day
+TMP_MAX_AGE_S = 24 * 3600
+DOWNLOAD_THREADS = 4
+# zlib level of joblib artifacts, trades little time for much smaller models
+JOBLIB_COMPRESSION = 3
+
+# formats that are read instead if an artifact is missing, e.g. in older runs
+FALLBACK_FORMATS = {"feather": "tsv"}
+
+
+def _handle_xml(filename, artifact=None):
+    if artifact:
+        artifact.write(filename)
+        return None
+    return ET.parse(filename)
+
+
+def _handle_json(filename, artifact=None):
+    if artifact:
+        with open(filename, "w", encoding="utf-8") as file:
+            json.dump(artifact, file)
+        return None
+    with open(filename, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def _handle_tsv(filename, artifact=None):
+    if artifact is None:
+        return pd.read_csv(filename, sep="\t")
+    artifact.to_csv(filename, sep="\t", index=False)
+    return None
+
+
+def _compact_dtypes(data: pd.DataFrame) -> pd.DataFrame:
+    # like tsv artifacts, feather artifacts do not keep the index
+    data = data.reset_index(drop=True)
+    for column in data.columns:
+        values = data[column]
+        if not pd.api.types.is_numeric_dtype(values):
+            continue
+        if column.startswith("nfp_"):
+            data[column] = values.astype("float32")
+        elif values.isin([0, 1]).all():
+            data[column] = values.astype("uint8")
+    return data
+
+
+def _handle_feather(filename, artifact=None):
+    if artifact is None:
+        return feather.read_table(filename, memory_map=True).to_pandas()
+    # uncompressed, so reads can be memory mapped
+    feather.write_feather(
+        _compact_dtypes(artifact), filename, compression="uncompressed"
+    )
+    return None
+
+
+def _handle_dimacs(filename, artifact=None):
+    if artifact:
+        with open(filename, "w", encoding="utf-8") as file:
+            file.write(artifact)
+            return None
+    with open(filename, "r", encoding="utf-8") as file:
+        return file.read()
+
+
+def _handle_joblib(filename, artifact=None):
+    # only the learning steps store models, the systems step lacks joblib
+    import joblib  # pylint: disable=import-outside-toplevel
+
+    if artifact is None:
+        return joblib.load(filename)
+    joblib.dump(artifact, filename, compress=JOBLIB_COMPRESSION)
+    return None
+
+
+def _file_handling(filename, artifact=None):
+    ending = filename.split(".")[-1]
+    handlers = {
+        "tsv": _handle_tsv,
+        "feather": _handle_feather,
+        "xml": _handle_xml,
+        "json": _handle_json,
+        "dimacs": _handle_dimacs,
+        "joblib": _handle_joblib,
+    }
+    return handlers[ending](filename, artifact)
+
+
+def _fallback_name(filename: str):
+    stem, ending = os.path.splitext(filename)
+    if ending[1:] in FALLBACK_FORMATS:
+        return stem + "." + FALLBACK_FORMATS[ending[1:]]
+    return None
+
+
+def cache_root() -> str:
+    """
+    Returns the root directory of the cache shared by all runs and processes.
+    It can be configured with the environment variable PIM_CACHE_DIR.
+    """
+    root = os.environ.get(CACHE_DIR_ENV, DEFAULT_CACHE_DIR)
+    os.makedirs(os.path.join(root, ".locks"), exist_ok=True)
+    os.makedirs(os.path.join(root, ".tmp"), exist_ok=True)
+    return root
+
+
+def _cache_budget() -> int:
+    return int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_CACHE_SIZE_MB)) * 1024**2
+
+
+def _acquire(lock_file: str, shared: bool = False, blocking: bool = True):
+    """
+    Returns the open lock file once it is locked. Lock files are removed
+    when their run is evicted, so the lock is only held if the file was not
+    replaced while waiting for it.
+    """
+    flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    while True:
+        file = open(lock_file, "a", encoding="utf-8")
+        try:
+            fcntl.flock(file, flags if blocking else flags | fcntl.LOCK_NB)
+            if os.path.exists(lock_file) and os.path.samestat(
+                os.fstat(file.fileno()), os.stat(lock_file)
+            ):
+                return file
+        except BaseException:
+            file.close()
+            raise
+        file.close()
+
+
+@contextmanager
+def _locked(lock_file: str, shared: bool = False, blocking: bool = True):
+    file = _acquire(lock_file, shared, blocking)
+    try:
+        yield
+    finally:
+        file.close()
+
+
+def _directory_size(directory: str) -> int:
+    size = 0
+    for path, _, files in os.walk(directory):
+        for file in files:
+            try:
+                size += os.path.getsize(os.path.join(path, file))
+            except OSError:
+                pass
+    return size
+
+
+def _latest_mtime(path: str) -> float:
+    latest = os.path.getmtime(path)
+    for directory, _, files in os.walk(path):
+        for file in files:
+            try:
+                latest = max(latest, os.path.getmtime(os.path.join(directory, file)))
+            except OSError:
+                pass
+    return latest
+
+
+def _remove_orphans(root: str):
+    """
+    Removes temporary files and download directories of processes that were
+    killed before they moved them into the cache.
+    """
+    tmp_dir = os.path.join(root, ".tmp")
+    for name in os.listdir(tmp_dir):
+        path = os.path.join(tmp_dir, name)
+        try:
+            if time.time() - _latest_mtime(path) < TMP_MAX_AGE_S:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            logging.info("Removed orphaned temporary file %s", name)
+        except OSError:
+            continue
+
+
+def _remove_run(root: str, name: str):
+    """
+    Removes the directory and the lock files of a run, unless it is in use.
+    Artifact locks are only taken while the run lock is held.
+    """
+    lock_file = os.path.join(root, ".locks", name + ".lock")
+    with _locked(lock_file, blocking=False):
+        for lock in os.listdir(os.path.join(root, ".locks")):
+            if lock.startswith(name + "-"):
+                os.remove(os.path.join(root, ".locks", lock))
+        shutil.rmtree(os.path.join(root, name))
+        os.remove(lock_file)
+
+
+def _evict(root: str, keep: str):
+    """
+    Removes least recently used run directories until the cache fits its budget.
+    Directories that are in use by other processes are skipped.
+    """
+    with _locked(os.path.join(root, ".locks", "eviction.lock")):
+        _remove_orphans(root)
+        entries = []
+        for name in os.listdir(root):
+            directory = os.path.join(root, name)
+            if name.startswith(".") or not os.path.isdir(directory):
+                continue
+            try:
+                entries.append(
+                    (os.path.getmtime(directory), _directory_size(directory), name)
+                )
+            except OSError:
+                continue
+
+        size = sum(entry[1] for entry in entries)
+        budget = _cache_budget()
+        for _, entry_size, name in sorted(entries):
+            if size <= budget:
+                break
+            directory = os.path.join(root, name)
+            if directory == keep:
+                continue
+            try:
+                _remove_run(root, name)
+                size -= entry_size
+                logging.info("Evicted run %s from cache", name)
+            except OSError:
+                continue
+
+
+class CacheHandler:
+    """
+    Handles interactions with the cache on the local filesystem from within runs.
+    Further handles caching for runs stored remotely. The cache is shared by
+    all runs and processes, bounded in size and evicts least recently used runs.
+    Artifacts of remote runs are downloaded individually when they are first
+    retrieved. As downloads are moved into the cache atomically, every file
+    present in the cache is complete.
+
+    ...
+
+    Attributes
+    ----------
+    cache_dir : str
+        the directory of the run maintained by this instance of CacheHandler class
+
+    Methods
+    -------
+    __init__(run_id, new_run):
+        Constructor, generates a CacheHandler instance
+
+    save(artifacts):
+        Takes artifacts and saves them in resp. directory
+
+    retrieve(ids):
+        Takes and id or a list of ids and returns the resp. artifacts from the cache.
+
+    close():
+        Releases the run, so it can be evicted.
+    """
+
+    def __init__(self, run_id: str, new_run: bool = True) -> None:
+        """
+        Constructor: instantiates CacheHandler for run.
+
+        Parameters
+        ----------
+        run_id : str
+            the run_id connected to this CacheHandler instance
+        new_run: bool
+            whether the cachehandler for this run is a new run.
+
+        """
+        self._root = cache_root()
+        self._run_id = run_id
+        self._new_run = new_run
+        self._lock_file = os.path.join(self._root, ".locks", run_id + ".lock")
+        self.cache_dir = os.path.join(self._root, run_id)
+        # runs that are still written are not evicted by other processes
+        self._run_lock = _acquire(self._lock_file, shared=True) if new_run else None
+        if new_run:
+            self._generate_cache()
+        else:
+            self._touch_cache()
+
+    def close(self):
+        """
+        Releases the run, so it can be evicted. Called when the handler is
+        garbage collected.
+        """
+        if getattr(self, "_run_lock", None) is not None:
+            self._run_lock.close()
+            self._run_lock = None
+
+    def __del__(self):
+        self.close()
+
+    def _generate_cache(self):
+        logging.info("Create cache directory for run %s", self.cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.existing_cache = False
+        logging.info("Successfully created cache directory for run %s", self.cache_dir)
+
+    def _touch_cache(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        os.utime(self.cache_dir)
+
+    def _download_artifact(self, filename: str):
+        target = os.path.join(self.cache_dir, filename)
+        lock_file = os.path.join(
+            self._root, ".locks", f"{self._run_id}-{filename.replace('/', '_')}.lock"
+        )
+        with _locked(lock_file):
+            if os.path.exists(target):
+                return
+            logging.info("Downloading %s of run %s to cache...", filename, self._run_id)
+            download_dir = os.path.join(self._root, ".tmp", uuid.uuid4().hex)
+            os.makedirs(download_dir)
+            try:
+                path = download_artifacts(
+                    run_id=self._run_id, artifact_path=filename, dst_path=download_dir
+                )
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(path, target)
+            finally:
+                shutil.rmtree(download_dir, ignore_errors=True)
+            logging.info("Download successful...")
+
+    def _download_with_fallback(self, filename: str) -> str:
+        try:
+            self._download_artifact(filename)
+            return filename
+        except Exception:
+            fallback = _fallback_name(filename)
+            if not fallback:
+                raise
+            logging.info("Artifact %s not available, use %s", filename, fallback)
+            self._download_artifact(fallback)
+            return fallback
+
+    def _load_artifacts_from_remote(self, filenames: list):
+        resolved = {}
+        missing = []
+        for filename in filenames:
+            fallback = _fallback_name(filename)
+            if os.path.exists(os.path.join(self.cache_dir, filename)):
+                resolved[filename] = filename
+            elif fallback and os.path.exists(os.path.join(self.cache_dir, fallback)):
+                resolved[filename] = fallback
+            else:
+                missing.append(filename)
+        if missing:
+            with ThreadPoolExecutor(max_workers=DOWNLOAD_THREADS) as executor:
+                resolved.update(
+                    zip(missing, executor.map(self._download_with_fallback, missing))
+                )
+        return [resolved[filename] for filename in filenames], len(missing) > 0
+
+    def save(self, artifacts: dict) -> None:
+        """
+        Takes artifacts and saves them.
+
+        Parameters
+        ----------
+        artifacts : dict[str, any]
+            Dictionary where keys are filenames and values are artifacts for storage.
+        """
+        for name, artifact in artifacts.items():
+            temp_file = os.path.join(self._root, ".tmp", uuid.uuid4().hex + "-" + name)
+            _file_handling(temp_file, artifact)
+            os.replace(temp_file, os.path.join(self.cache_dir, name))
+        _evict(self._root, self.cache_dir)
+
+    def _load_artifact(self, filename: str) -> any:
+
+        filename = os.path.join(self.cache_dir, filename)
+        try:
+            logging.info("Retrieve artifact %s from cache...", filename)
+            artifact = _file_handling(filename)
+        except:
+            logging.error("Can not retrieve artifact %s", filename)
+            time.sleep(120)
+            raise Exception
+        logging.info(" Succssesfully retrieved artifact %s from cache...")
+        return artifact
+
+    def retrieve(self, filenames) -> any:
+        """
+        Takes filenames and returns the corresponding artifacts.
+        Artifacts of remote runs that are not cached yet are downloaded,
+        concurrently if multiple filenames are given. Feather artifacts
+        missing in a run are read from their tsv counterpart.
+
+        Parameters
+        ----------
+        filenames : list | str
+            filenames
+        """
+        names = filenames if isinstance(filenames, list) else [filenames]
+        with _locked(self._lock_file, shared=True):
+            downloaded = False
+            if not self._new_run:
+                # the run might have been evicted by another process in the meantime
+                self._touch_cache()
+                names, downloaded = self._load_artifacts_from_remote(names)
+            artifacts = [self._load_artifact(name) for name in names]
+        if downloaded:
+            _evict(self._root, self.cache_dir)
+
+        if isinstance(filenames, list):
+            return artifacts
+        return artifacts[0]
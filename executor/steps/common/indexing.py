@@ -0,0 +1,64 @@
+"""
+Stable integer ids for configurations, used to look up sampled configurations
+in the measurements of a system without merging tables.
+"""
+import numpy as np
+import pandas as pd
+
+# binary options that fit into one packed id
+MAX_PACKED_OPTIONS = 64
+
+
+def configuration_ids(configs: pd.DataFrame, binary: list, numeric: list):
+    """
+    Returns one uint64 id per configuration. Without numeric options and with
+    at most 64 binary options, the id is the bitset of selected options.
+    Otherwise, the option values are hashed.
+
+    Parameters
+    ----------
+    configs : pd.DataFrame
+        configurations with one column per option
+    binary : list
+        names of binary options, in the order of the feature model
+    numeric : list
+        names of numeric options
+    """
+    if not numeric and len(binary) <= MAX_PACKED_OPTIONS:
+        bits = configs[binary].to_numpy(dtype=np.uint64)
+        shifts = np.arange(len(binary), dtype=np.uint64)
+        return np.bitwise_or.reduce(bits << shifts, axis=1, initial=np.uint64(0))
+
+    # float64, so ids do not depend on the dtypes of the artifact format
+    options = configs[list(binary) + list(numeric)].astype("float64")
+    return pd.util.hash_pandas_object(options, index=False).to_numpy()
+
+
+def index_frame(ids) -> pd.DataFrame:
+    """
+    Returns the index artifact, the id of the configuration in each row.
+    """
+    return pd.DataFrame({"config_id": ids})
+
+
+def lookup(index_ids, ids):
+    """
+    Returns the row of each id in the index, -1 for unmeasured configurations.
+    For duplicate configurations, the first row is returned.
+
+    Parameters
+    ----------
+    index_ids : np.ndarray
+        ids of all measured configurations, in row order
+    ids : np.ndarray
+        ids of the configurations to look up
+    """
+    index_ids = np.asarray(index_ids, dtype=np.uint64)
+    ids = np.asarray(ids, dtype=np.uint64)
+    if not len(index_ids):
+        return np.full(len(ids), -1, dtype=np.int64)
+
+    order = np.argsort(index_ids, kind="stable")
+    sorted_ids = index_ids[order]
+    positions = np.minimum(np.searchsorted(sorted_ids, ids), len(order) - 1)
+    return np.where(sorted_ids[positions] == ids, order[positions], -1)
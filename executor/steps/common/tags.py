@@ -0,0 +1,10 @@
+"""
+Tags that steps set on their runs for other steps to read.
+"""
+
+# tag of sampling runs that only store the rows of sampled configurations
+SAMPLE_ARTIFACT_TAG = "sample_artifact"
+# value of SAMPLE_ARTIFACT_TAG for index-only samples, see sample.json
+INDEX_SAMPLE = "index"
+# tag of samples that contain all smaller samples with the same tag value
+NESTED_SAMPLE_TAG = "nested_sample"
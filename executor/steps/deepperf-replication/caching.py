@@ -0,0 +1 @@
+../common/caching.py
\ No newline at end of file
@@ -0,0 +1,401 @@
+import os
+import time
+import json
+import hashlib
+import logging
+
+import click
+import mlflow
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from rich.logging import RichHandler
+from sklearn.model_selection import train_test_split
+
+from caching import CacheHandler
+from tags import SAMPLE_ARTIFACT_TAG, INDEX_SAMPLE
+
+TUNING_KEY_TAG = "tuning_key"
+
+# sampling params that differ between repetitions of the same setting
+_REPETITION_PARAMS = ["seed", "logs_to_artifact", "artifact_format", "index_only"]
+
+# search spaces of DeepPerf
+LEARNING_RATES = np.logspace(np.log10(1e-10), np.log10(0.1), 10)
+LAYERS = list(range(3, 21))
+REGULARIZATION_PARAMS = np.logspace(np.log10(1e-10), np.log10(10), 30)
+HIDDEN_UNITS = 128
+# relative decrease of the validation error that counts as improvement
+MIN_IMPROVEMENT = 1e-3
+# smallest denominator of relative validation errors, for targets that are 0
+MIN_RELATIVE_DENOMINATOR = 1e-8
+INITIALIZATION = "glorot_normal"
+
+
+def activate_logging(logs_to_artifact):
+    with open("logs.txt", "w", encoding="utf-8"):
+        pass
+    if logs_to_artifact:
+        return logging.basicConfig(
+            filename="logs.txt",
+            level=logging.INFO,
+            force=True,
+            format="LEARNING    %(message)s",
+        )
+    return logging.basicConfig(
+        level=logging.INFO,
+        force=True,
+        format="LEARNING    %(message)s",
+        handlers=[RichHandler()],
+    )
+
+
+def _split_features(data: pd.DataFrame, nfp: str):
+    Y = data["nfp_" + nfp].to_numpy(dtype=np.float32)
+    X = data.drop([col for col in data.columns if "nfp_" in col], axis=1)
+    return X.to_numpy(dtype=np.float32), Y
+
+
+def _load_data(sampling_run_id: str, nfp: str):
+    """
+    Returns train and test data of a sampling run. Index-only samples are
+    resolved against the measurements of their system run.
+    """
+    sampling_cache = CacheHandler(sampling_run_id, new_run=False)
+    tags = mlflow.get_run(sampling_run_id).data.tags
+    if tags.get(SAMPLE_ARTIFACT_TAG) != INDEX_SAMPLE:
+        train = sampling_cache.retrieve("train.feather")
+        test = sampling_cache.retrieve("test.feather")
+        return _split_features(train, nfp) + _split_features(test, nfp)
+
+    sample = sampling_cache.retrieve("sample.json")
+    system_cache = CacheHandler(sample["system_run_id"], new_run=False)
+    data = system_cache.retrieve("measurements.feather")
+    in_test = np.ones(len(data), dtype=bool)
+    in_test[sample["train"]] = False
+    return _split_features(data.iloc[sample["train"]], nfp) + _split_features(
+        data[in_test], nfp
+    )
+
+
+def _scale_data(X, y, max_xy=None):
+    if not max_xy:
+        max_x = np.amax(X, axis=0)
+        # options that are never selected in the sample stay 0
+        max_x[max_x == 0] = 1
+        X = np.divide(X, max_x)
+
+        max_y = np.max(y)
+        if max_y == 0:
+            raise ValueError("The nfp is 0 for all sampled configurations.")
+        y = np.divide(y, max_y)
+
+        return X, y, max_x, max_y
+
+    return (np.divide(X, max_xy[0]), np.divide(y, max_xy[1]))
+
+
+def _tuning_key(sampling_run_id: str, nfp: str) -> str:
+    """
+    Returns a key shared by learning runs on repetitions of the same
+    sampling setting, i.e. samples of the same system, method and size.
+    """
+    params = mlflow.get_run(sampling_run_id).data.params
+    content = {k: v for k, v in params.items() if k not in _REPETITION_PARAMS}
+    content["nfp"] = nfp
+    return hashlib.sha256(
+        json.dumps(content, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def _previous_tuning(tuning_key: str):
+    """
+    Returns the hyperparameters of the latest finished run with the same key,
+    None if there is none.
+    """
+    runs = mlflow.search_runs(
+        filter_string=f"tags.{TUNING_KEY_TAG} = '{tuning_key}'"
+        " AND attribute.status = 'FINISHED'"
+    )
+    if runs.empty:
+        return None
+    previous = runs.iloc[0]
+    logging.info("Reuse hyperparameters of run %s.", previous["run_id"])
+    return (
+        int(previous["params.tuned_n_layers"]),
+        float(previous["params.tuned_learning_rate"]),
+        float(previous["params.tuned_regularization"]),
+        int(previous["params.best_epoch"]),
+    )
+
+
+def _get_hidden_layer(initialization):
+    return tf.keras.layers.Dense(
+        HIDDEN_UNITS,
+        activation="relu",
+        kernel_initializer=initialization,
+    )
+
+
+def _get_output_layer(initialization):
+    return tf.keras.layers.Dense(
+        1, activation="linear", kernel_initializer=initialization
+    )
+
+
+def _forward(tower: list, X):
+    first = tower[0](X)
+    output = first
+    for layer in tower[1:]:
+        output = layer(output)
+    return output, first
+
+
+def _train_candidates(candidates: list, train: tuple, val, epochs, patience):
+    """
+    Trains candidate networks side by side in one graph, with full batches as
+    DeepPerf. Every candidate has its own optimizer, the gradients of all
+    candidates are computed in one pass. With validation data, training stops
+    when no candidate improved its validation error for patience epochs.
+
+    Parameters
+    ----------
+    candidates : list[tuple]
+        hidden layers, learning rate and L1 regularization of the activity of
+        the first layer of each candidate, 0 for plain networks
+    train : tuple
+        scaled options and nfp to train on
+    val : tuple | None
+        scaled options and nfp to compute the relative error on, None to
+        train for all epochs
+    epochs : int
+        maximal number of epochs
+    patience : int
+        number of epochs without improvement after which training stops
+
+    Returns the trained networks as lists of layers, the lowest validation
+    error of each candidate and its epoch.
+    """
+    X, y = tf.constant(train[0]), tf.constant(train[1].reshape(-1, 1))
+    towers = [
+        [_get_hidden_layer(INITIALIZATION) for _ in range(n_layers)]
+        + [_get_output_layer(INITIALIZATION)]
+        for n_layers, _, _ in candidates
+    ]
+    optimizers = [
+        tf.keras.optimizers.Adam(learning_rate=learning_rate)
+        for _, learning_rate, _ in candidates
+    ]
+    regularization = [float(param) for _, _, param in candidates]
+    for tower in towers:
+        _forward(tower, X)
+    variables = [
+        [variable for layer in tower for variable in layer.trainable_variables]
+        for tower in towers
+    ]
+
+    def train_step():
+        with tf.GradientTape() as tape:
+            losses = []
+            for tower, param in zip(towers, regularization):
+                output, first = _forward(tower, X)
+                # L1 activity regularization per sample, like tf.keras 2
+                activity = tf.reduce_sum(tf.abs(first)) / tf.cast(
+                    tf.shape(X)[0], tf.float32
+                )
+                losses.append(tf.reduce_mean(tf.square(output - y)) + param * activity)
+            loss = tf.add_n(losses)
+        # candidates do not share weights, so each gets only its own gradient
+        gradients = tape.gradient(loss, variables)
+        for optimizer, tower_gradients, tower_variables in zip(
+            optimizers, gradients, variables
+        ):
+            optimizer.apply_gradients(zip(tower_gradients, tower_variables))
+
+    # the first step creates the optimizer variables outside of the graph
+    train_step()
+    graph_step = tf.function(train_step)
+
+    best_errors = np.full(len(candidates), np.inf)
+    if val is None:
+        for _ in range(epochs - 1):
+            graph_step()
+        return towers, best_errors, np.full(len(candidates), epochs)
+
+    best_epochs = np.ones(len(candidates), dtype=int)
+    X_val, y_val = tf.constant(val[0]), tf.constant(val[1].reshape(-1, 1))
+    denominator = tf.maximum(tf.abs(y_val), MIN_RELATIVE_DENOMINATOR)
+
+    @tf.function
+    def validation_errors():
+        return tf.stack(
+            [
+                tf.reduce_mean(
+                    tf.abs((_forward(tower, X_val)[0] - y_val) / denominator)
+                )
+                for tower in towers
+            ]
+        )
+
+    for epoch in range(1, epochs + 1):
+        if epoch > 1:
+            graph_step()
+        errors = validation_errors().numpy()
+        improved = errors < best_errors * (1 - MIN_IMPROVEMENT)
+        best_errors[improved] = errors[improved]
+        best_epochs[improved] = epoch
+        if epoch - best_epochs.max() >= patience:
+            logging.info(
+                "Stop training of %i candidates after %i epochs.",
+                len(candidates),
+                epoch,
+            )
+            break
+    return towers, best_errors, best_epochs
+
+
+def _find_hyperparameters(X_train, y_train, epochs, patience, seed):
+    """
+    Tunes learning rate, depth and regularization in the order of DeepPerf,
+    training all candidates of a step as one batch.
+    """
+    X_train, X_val, y_train, y_val = train_test_split(
+        X_train, y_train, train_size=0.66, random_state=seed
+    )
+
+    def search(candidates):
+        _, errors, best_epochs = _train_candidates(
+            candidates, (X_train, y_train), (X_val, y_val), epochs, patience
+        )
+        finite = np.isfinite(errors)
+        if not finite.any():
+            logging.warning("No candidate has a finite error, use the first.")
+        best = int(np.argmin(np.where(finite, errors, np.inf)))
+        logging.info("Best candidate %s, error %f", candidates[best], errors[best])
+        return candidates[best], int(best_epochs[best])
+
+    (_, learning_rate, _), _ = search([(2, lr, 0) for lr in LEARNING_RATES])
+    (n_layers, _, _), _ = search([(n, learning_rate, 0) for n in LAYERS])
+    (_, learning_rate, _), _ = search(
+        [(n_layers + 5, lr, 0) for lr in LEARNING_RATES]
+    )
+    # the sparse network has an additional regularized first layer
+    (_, _, regularization), best_epoch = search(
+        [(n_layers + 6, learning_rate, rp) for rp in REGULARIZATION_PARAMS]
+    )
+    return n_layers, learning_rate, regularization, best_epoch
+
+
+@click.command(help="Learn from sampled configurations with DeepPerf")
+@click.option("--sampling_run_id")
+@click.option("--nfp")
+@click.option("--logs_to_artifact", type=bool, default=False)
+@click.option(
+    "--artifact_format", type=click.Choice(["tsv", "feather"]), default="tsv"
+)
+@click.option("--epochs", type=int, default=2000)
+@click.option("--patience", type=int, default=100)
+@click.option("--reuse_tuning", type=bool, default=False)
+@click.option("--seed", type=int, default=5)
+def learning(
+    sampling_run_id: str = "",
+    nfp: str = "",
+    logs_to_artifact: bool = False,
+    artifact_format: str = "tsv",
+    epochs: int = 2000,
+    patience: int = 100,
+    reuse_tuning: bool = False,
+    seed: int = 5,
+):
+    """
+    Learning of influences of options on nfp with DeepPerf
+
+    Parameters
+    ----------
+    sampling_run_id : str
+        run with sampled configurations as artifacts
+    nfp : str
+        name of nfp
+    artifact_format : str
+        format of the predictions, tsv or feather
+    epochs : int
+        maximal number of epochs of every network
+    patience : int
+        epochs without improvement of the validation error before stopping
+    reuse_tuning : bool
+        use the hyperparameters of the latest run on a repetition of the same
+        sampling setting instead of tuning them again
+    seed : int
+        seed of tensorflow and of the validation split
+    """
+    activate_logging(logs_to_artifact)
+    logging.info("Start learning from sampled configurations.")
+    tf.random.set_seed(seed)
+
+    # load data
+    train_x, train_y, test_x, test_y = _load_data(sampling_run_id, nfp)
+    train_x, train_y, max_x, max_y = _scale_data(train_x, train_y)
+    tuning_key = _tuning_key(sampling_run_id, nfp)
+
+    with mlflow.start_run() as run:
+        try:
+            model_cache = CacheHandler(run.info.run_id)
+            mlflow.set_tag(TUNING_KEY_TAG, tuning_key)
+            start = time.perf_counter_ns()
+
+            tuning = _previous_tuning(tuning_key) if reuse_tuning else None
+            if tuning is None:
+                tuning = _find_hyperparameters(
+                    train_x, train_y, epochs, patience, seed
+                )
+            n_layers, learning_rate, regularization, best_epoch = tuning
+
+            # the validation error of the tuned network was lowest at best_epoch
+            (network,), _, _ = _train_candidates(
+                [(n_layers + 6, learning_rate, regularization)],
+                (train_x, train_y),
+                None,
+                best_epoch,
+                patience,
+            )
+            end = time.perf_counter_ns()
+            mlflow.log_metric("learning_time", (end - start) * 0.000000001)
+            # epochs is the maximum given as entry point param, the tuned
+            # values get own names so they do not overwrite params of the run
+            mlflow.log_params(
+                {
+                    "tuned_n_layers": n_layers,
+                    "tuned_learning_rate": learning_rate,
+                    "tuned_regularization": regularization,
+                    "best_epoch": best_epoch,
+                }
+            )
+
+            logging.info("Predict on test set and save to cache.")
+            test_x, _ = _scale_data(test_x, test_y, (max_x, max_y))
+            prediction = pd.DataFrame(
+                {
+                    "predicted": _forward(network, tf.constant(test_x))[0]
+                    .numpy()
+                    .ravel()
+                    * max_y,
+                    "measured": test_y,
+                }
+            )
+            prediction_file = f"predicted.{artifact_format}"
+            model_cache.save({prediction_file: prediction})
+            mlflow.log_artifact(
+                os.path.join(model_cache.cache_dir, prediction_file), ""
+            )
+
+        except Exception as e:
+            logging.error("During learning the following error occured: %s", e)
+            raise e
+        finally:
+            if logs_to_artifact:
+                mlflow.log_artifact("logs.txt", "")
+
+
+if __name__ == "__main__":
+    # pylint: disable-next=no-value-for-parameter
+    learning()
@@ -1,10 +1,16 @@
+import time
 import logging
-import click
+from concurrent.futures import ThreadPoolExecutor
 
+import click
+import numpy as np
 import mlflow
-from sklearn.metrics import mean_absolute_percentage_error, mean_absolute_error
+from mlflow.entities import Metric
+from mlflow.tracking import MlflowClient
 from caching import CacheHandler
 
+DOWNLOAD_THREADS = 8
+
 
 def activate_logging(logs_to_artifact):
     with open("logs.txt", "w", encoding="utf-8"):
@@ -13,10 +19,12 @@ def activate_logging(logs_to_artifact):
         return logging.basicConfig(
             filename="logs.txt",
             level=logging.INFO,
+            force=True,
             format="EVALUATION    %(message)s",
         )
     return logging.basicConfig(
         level=logging.INFO,
+        force=True,
         format="EVALUATION    %(message)s",
     )
 
@@ -32,8 +40,99 @@ def update_metrics(run_id: str, metric: dict[str, any]):
     metric : dict[str, any]
         metrics to update
     """
-    with mlflow.start_run(run_id):
-        mlflow.log_metrics(metric)
+    timestamp = int(time.time() * 1000)
+    MlflowClient().log_batch(
+        run_id,
+        metrics=[Metric(k, float(v), timestamp, 0) for k, v in metric.items()],
+    )
+
+
+def _load_prediction(run_id: str):
+    return CacheHandler(run_id, new_run=False).retrieve("predicted.feather")
+
+
+def _load_predictions(run_ids: list):
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_THREADS) as executor:
+        return list(executor.map(_load_prediction, run_ids))
+
+
+def _targets(prediction) -> dict:
+    """
+    Returns the predicted and measured column of each nfp in a prediction,
+    keyed by the suffix of their metrics. Predictions of multi-target runs
+    have columns predicted.<nfp> and measured.<nfp>.
+    """
+    if "predicted" in prediction.columns:
+        return {"": ("predicted", "measured")}
+    return {
+        column[len("predicted") :]: (column, "measured" + column[len("predicted") :])
+        for column in prediction.columns
+        if column.startswith("predicted.")
+    }
+
+
+def compute_metrics(predictions: list) -> list:
+    """
+    Computes error metrics for multiple predictions in one pass. Metrics of
+    multi-target predictions are suffixed with the name of the nfp.
+
+    Parameters
+    ----------
+    predictions : list[pd.DataFrame]
+        predictions with columns predicted and measured, or predicted.<nfp>
+        and measured.<nfp> for each nfp, with at least one row each
+    """
+    if not predictions:
+        return []
+    empty = [i for i, pred in enumerate(predictions) if pred.empty]
+    if empty:
+        raise ValueError(f"Predictions {empty} have no rows to compute metrics on.")
+
+    # one group per predicted nfp
+    groups = [
+        (i, suffix, pred[columns[0]], pred[columns[1]])
+        for i, pred in enumerate(predictions)
+        for suffix, columns in _targets(pred).items()
+    ]
+    if not groups:
+        raise ValueError("Predictions have no predicted and measured columns.")
+    lengths = np.array([len(group[2]) for group in groups])
+    group_ids = np.repeat(np.arange(len(groups)), lengths)
+    measured = np.concatenate(
+        [group[3].to_numpy(dtype=np.float64) for group in groups]
+    )
+    predicted = np.concatenate(
+        [group[2].to_numpy(dtype=np.float64) for group in groups]
+    )
+
+    absolute_error = np.abs(predicted - measured)
+    # same definition as sklearn.metrics.mean_absolute_percentage_error
+    percentage_error = absolute_error / np.maximum(
+        np.abs(measured), np.finfo(np.float64).eps
+    )
+    mae = np.bincount(group_ids, absolute_error, len(groups)) / lengths
+    mape = np.bincount(group_ids, percentage_error, len(groups)) / lengths
+
+    metrics = [{} for _ in predictions]
+    for g, (i, suffix, _, _) in enumerate(groups):
+        metrics[i].update(
+            {
+                "mape" + suffix: mape[g],
+                "mre" + suffix: mape[g] / 100,
+                "mae" + suffix: mae[g],
+            }
+        )
+    return metrics
+
+
+def _collect_run_ids(learning_run_id: str, learning_run_ids: str, run_list_id: str):
+    run_ids = [learning_run_id] if learning_run_id else []
+    if learning_run_ids:
+        run_ids += [idx for idx in learning_run_ids.split(",") if idx]
+    if run_list_id:
+        run_list = CacheHandler(run_list_id, new_run=False)
+        run_ids += run_list.retrieve("learning_runs.json")
+    return run_ids
 
 
 @click.command(
@@ -43,10 +142,14 @@ def update_metrics(run_id: str, metric: dict[str, any]):
         allow_extra_args=True,
     ),
 )
-@click.option("--learning_run_id")
+@click.option("--learning_run_id", default="")
+@click.option("--learning_run_ids", default="")
+@click.option("--run_list_id", default="")
 @click.option("--logs_to_artifacts", type=bool, default=True)
 def evaluate(
     learning_run_id: str = "",
+    learning_run_ids: str = "",
+    run_list_id: str = "",
     logs_to_artifacts: bool = False,
 ):
     """
@@ -56,16 +159,28 @@ def evaluate(
     ----------
     learning_run_id : str
         run that corresponds to learning run that should be evaluated
+    learning_run_ids : str
+        comma separated list of learning runs that should be evaluated
+    run_list_id : str
+        run with artifact learning_runs.json listing learning runs to evaluate
     """
     activate_logging(logs_to_artifacts)
     logging.info("Start evaluation...")
-    cache = CacheHandler(learning_run_id, new_run=False)
-    pred = cache.retrieve("predicted.tsv")
-    mae = mean_absolute_error(pred["measured"], pred["predicted"])
-    mape = mean_absolute_percentage_error(pred["measured"], pred["predicted"])
+    run_ids = _collect_run_ids(learning_run_id, learning_run_ids, run_list_id)
+    if not run_ids:
+        logging.warning("No learning runs to evaluate.")
+        return
+    predictions = _load_predictions(run_ids)
+    empty = [idx for idx, pred in zip(run_ids, predictions) if pred.empty]
+    if empty:
+        raise ValueError(
+            f"Learning runs {', '.join(empty)} predicted no configurations."
+        )
+    metrics = compute_metrics(predictions)
 
-    logging.info("Update learning runs...")
-    update_metrics(learning_run_id, {"mape": mape, "mre": mape / 100, "mae": mae})
+    logging.info("Update %i learning runs...", len(run_ids))
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_THREADS) as executor:
+        list(executor.map(update_metrics, run_ids, metrics))
     if logs_to_artifacts:
         mlflow.log_artifact("logs.txt", "")
 
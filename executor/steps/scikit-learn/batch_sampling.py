@@ -0,0 +1,103 @@
+import logging
+import numpy as np
+import mlflow
+import click
+from caching import CacheHandler
+from sampling import _sample_artifact, activate_logging
+from tags import SAMPLE_ARTIFACT_TAG, INDEX_SAMPLE, NESTED_SAMPLE_TAG
+
+
+def _parse_list(values: str):
+    return [int(value) for value in str(values).split(",") if value.strip()]
+
+
+def nested_random_samples(n_rows: int, sizes: list, seeds: list) -> dict:
+    """
+    Draws samples without replacement for all combinations of sizes and seeds
+    in one pass. Samples of one seed are nested, i.e. each sample contains
+    all smaller samples of the same seed.
+
+    Parameters
+    ----------
+    n_rows : int
+        number of configurations to sample from
+    sizes : list[int]
+        sample sizes
+    seeds : list[int]
+        seeds of the random number generator, one permutation per seed
+    """
+    if max(sizes) > n_rows:
+        raise ValueError(f"Can not sample {max(sizes)} of {n_rows} configurations.")
+    keys = np.stack([np.random.default_rng(seed).random(n_rows) for seed in seeds])
+    permutations = np.argsort(keys, axis=1)[:, : max(sizes)]
+    return {
+        (size, seed): permutations[i, :size]
+        for i, seed in enumerate(seeds)
+        for size in sizes
+    }
+
+
+@click.command(help="Sample many random samples in one run.")
+@click.option("--system_run_id", default="")
+@click.option("--sizes", default="10")
+@click.option("--seeds", default="1")
+@click.option("--logs_to_artifact", type=bool, default=False)
+def batch_sample(
+    system_run_id: str = "",
+    sizes: str = "10",
+    seeds: str = "1",
+    logs_to_artifact: bool = False,
+):
+    """
+    Samples random configurations for every combination of sizes and seeds.
+    Each sample is logged as index-only artifact to a nested run.
+
+    Parameters
+    ----------
+    system_run_id : str
+        run of system loading
+    sizes : str
+        comma separated sample sizes
+    seeds : str
+        comma separated seeds
+    """
+    activate_logging(logs_to_artifact)
+
+    logging.info("Start batch sampling from configuration space.")
+    logging.warning("Only use this method when all valid configurations are available.")
+
+    with mlflow.start_run() as run:
+        system_cache = CacheHandler(system_run_id, new_run=False)
+        n_rows = len(system_cache.retrieve("measurements.feather"))
+        samples = nested_random_samples(n_rows, _parse_list(sizes), _parse_list(seeds))
+
+        for (size, seed), train in samples.items():
+            with mlflow.start_run(nested=True) as child:
+                sampling_cache = CacheHandler(child.info.run_id)
+                sampling_cache.save(
+                    {"sample.json": _sample_artifact(system_run_id, train)}
+                )
+                mlflow.set_tags(
+                    {
+                        SAMPLE_ARTIFACT_TAG: INDEX_SAMPLE,
+                        # samples of a seed are drawn from one permutation
+                        NESTED_SAMPLE_TAG: f"{run.info.run_id}-{seed}",
+                    }
+                )
+                mlflow.log_params(
+                    {
+                        "system_run_id": system_run_id,
+                        "method": "random",
+                        "n": size,
+                        "seed": seed,
+                    }
+                )
+                mlflow.log_artifacts(sampling_cache.cache_dir, "")
+        logging.info("Logged %i samples to run %s", len(samples), run.info.run_id)
+        if logs_to_artifact:
+            mlflow.log_artifact("logs.txt", "")
+
+
+if __name__ == "__main__":
+    # pylint: disable-next=no-value-for-parameter
+    batch_sample()
@@ -0,0 +1,244 @@
+"""
+Kernel estimators on precomputed Gram matrices. Hyperparameter searches pass
+row indices instead of configurations, so every distinct kernel is computed
+once on all samples and sliced for the folds and regularization values.
+"""
+import os
+import hashlib
+import threading
+import logging
+import weakref
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import numpy as np
+from sklearn.base import BaseEstimator, RegressorMixin, clone
+from sklearn.metrics.pairwise import pairwise_kernels
+from sklearn.svm import SVR
+from sklearn.kernel_ridge import KernelRidge
+
+KERNEL_CACHE_SIZE_ENV = "PIM_KERNEL_CACHE_MB"
+DEFAULT_KERNEL_CACHE_SIZE_MB = 1024
+
+
+class GramData:
+    """
+    Handle of the data Gram matrices are computed on, hashed once. Estimators
+    take the handle as parameter, and clones of them share it instead of
+    copying the data.
+
+    ...
+
+    Attributes
+    ----------
+    data : np.ndarray
+        the configurations
+    key : str
+        hash of the data
+    """
+
+    def __init__(self, data, key: str):
+        self.data = data
+        self.key = key
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __repr__(self):
+        return f"GramData({self.key[:12]}, shape={self.data.shape})"
+
+
+class GramCache:
+    """
+    Least recently used cache of Gram matrices, bounded in memory. Each
+    process of a search has its own cache.
+
+    ...
+
+    Attributes
+    ----------
+    max_bytes : int
+        memory budget of the cached matrices
+
+    Methods
+    -------
+    register(data):
+        returns the handle of the data, shared by all requests for equal data
+    get(data, key, metric, **params):
+        returns the Gram matrix of the data, computed on the first request
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._data = weakref.WeakValueDictionary()
+        self._matrices = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def register(self, data) -> GramData:
+        """returns the handle of the data, shared by all requests for equal data"""
+        data = np.ascontiguousarray(data, dtype=np.float64)
+        key = hashlib.sha1(data.tobytes()).hexdigest() + str(data.shape)
+        with self._lock:
+            handle = self._data.get(key)
+            if handle is None:
+                handle = GramData(data, key)
+                self._data[key] = handle
+            return handle
+
+    def get(self, data: GramData, key, metric, **params):
+        """returns the Gram matrix of the data, computed on the first request"""
+        key = (data.key, key)
+        with self._lock:
+            if key in self._matrices:
+                self._matrices.move_to_end(key)
+                return self._matrices[key]
+
+        matrix = pairwise_kernels(data.data, metric=metric, **params)
+        with self._lock:
+            if key not in self._matrices:
+                self._matrices[key] = matrix
+                self._size += matrix.nbytes
+            while self._size > self.max_bytes and len(self._matrices) > 1:
+                _, evicted = self._matrices.popitem(last=False)
+                self._size -= evicted.nbytes
+        return matrix
+
+
+_gram_cache = GramCache(
+    int(os.environ.get(KERNEL_CACHE_SIZE_ENV, DEFAULT_KERNEL_CACHE_SIZE_MB))
+    * 1024**2
+)
+
+
+class _PrecomputedKernelRegressor(ABC, RegressorMixin, BaseEstimator):
+    """
+    Base of regressors that are fitted on row indices of data, given as
+    GramData handle. Subclasses define the kernel parameters and the
+    regressor on the Gram matrix.
+    """
+
+    @abstractmethod
+    def _kernel(self, n_features: int):
+        """returns the metric and parameters of the kernel"""
+
+    @abstractmethod
+    def _regressor(self):
+        """returns the regressor fitted on the Gram matrix"""
+
+    def _gram(self):
+        metric, params = self._kernel(self.data.data.shape[1])
+        # parameters a kernel does not use do not change its matrix
+        key = (metric,) + tuple(sorted(params.items()))
+        return _gram_cache.get(self.data, key, metric, **params)
+
+    def fit(self, X, y):
+        self.rows_ = np.asarray(X, dtype=np.int64)[:, 0]
+        gram = self._gram()
+        self.regressor_ = self._regressor().fit(
+            gram[np.ix_(self.rows_, self.rows_)], y
+        )
+        return self
+
+    def predict(self, X):
+        rows = np.asarray(X, dtype=np.int64)[:, 0]
+        return self.regressor_.predict(self._gram()[np.ix_(rows, self.rows_)])
+
+
+class PrecomputedSVR(_PrecomputedKernelRegressor):
+    """SVR on a precomputed Gram matrix, with the kernel semantics of SVR"""
+
+    def __init__(
+        self, data=None, kernel="rbf", degree=3, gamma="scale", C=1.0, epsilon=0.1
+    ):
+        self.data = data
+        self.kernel = kernel
+        self.degree = degree
+        self.gamma = gamma
+        self.C = C
+        self.epsilon = epsilon
+
+    def _kernel(self, n_features: int):
+        if self.kernel == "linear":
+            return "linear", {}
+        gamma = self.gamma
+        if gamma == "scale":
+            gamma = 1.0 / (n_features * self.data.data[self.rows_].var())
+        elif gamma == "auto":
+            gamma = 1.0 / n_features
+        if self.kernel == "rbf":
+            return "rbf", {"gamma": gamma}
+        return self.kernel, {"gamma": gamma, "degree": self.degree, "coef0": 0.0}
+
+    def _regressor(self):
+        return SVR(kernel="precomputed", C=self.C, epsilon=self.epsilon)
+
+
+class PrecomputedKernelRidge(_PrecomputedKernelRegressor):
+    """KernelRidge on a precomputed Gram matrix, with its kernel semantics"""
+
+    def __init__(self, data=None, kernel="linear", degree=3, gamma=None, alpha=1.0):
+        self.data = data
+        self.kernel = kernel
+        self.degree = degree
+        self.gamma = gamma
+        self.alpha = alpha
+
+    def _kernel(self, n_features: int):
+        if self.kernel == "linear":
+            return "linear", {}
+        gamma = 1.0 / n_features if self.gamma is None else self.gamma
+        if self.kernel == "rbf":
+            return "rbf", {"gamma": gamma}
+        return self.kernel, {"gamma": gamma, "degree": self.degree, "coef0": 1.0}
+
+    def _regressor(self):
+        return KernelRidge(kernel="precomputed", alpha=self.alpha)
+
+
+def gram_data(data) -> GramData:
+    """returns the handle of data to pass to precomputed kernel estimators"""
+    return _gram_cache.register(data)
+
+
+precomputed_estimators = {
+    "svr": PrecomputedSVR,
+    "kr": PrecomputedKernelRidge,
+}
+
+
+class PrecomputedKernelSearch:
+    """
+    Runs a hyperparameter search of a precomputed kernel estimator on row
+    indices and refits the best parameters with the regular estimator, so the
+    result predicts configurations. Exposes the results like the search.
+
+    ...
+
+    Attributes
+    ----------
+    best_params_ : dict
+        parameters of the best candidate
+    best_score_ : float
+        mean score of the best candidate over all folds
+    best_estimator_ : estimator
+        the regular estimator with the best parameters, fitted on all data
+
+    Methods
+    -------
+    fit(X, y):
+        searches the parameters and refits the best candidate
+    """
+
+    def __init__(self, search, estimator):
+        self.search = search.set_params(refit=False)
+        self.estimator = estimator
+
+    def fit(self, X, y):
+        """searches the parameters and refits the best candidate"""
+        logging.info("Search on precomputed kernel matrices.")
+        self.search.fit(np.arange(len(X)).reshape(-1, 1), y)
+        self.best_params_ = self.search.best_params_
+        self.best_score_ = self.search.best_score_
+        self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_)
+        self.best_estimator_.fit(X, y)
+        return self
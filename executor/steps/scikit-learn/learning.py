@@ -1,11 +1,19 @@
 from caching import CacheHandler
+from tags import SAMPLE_ARTIFACT_TAG, INDEX_SAMPLE, NESTED_SAMPLE_TAG
+from warm_starting import SWEEPABLE, EnsembleSweepSearch, narrow_param_space
+from kernels import PrecomputedKernelSearch, gram_data, precomputed_estimators
 from rich.logging import RichHandler
+import numpy as np
 import pandas as pd
 import mlflow.sklearn
 import mlflow
 import click
 import logging
 import time
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
 
 import os
 
@@ -17,7 +25,14 @@ from sklearn.ensemble import BaggingRegressor
 from sklearn.svm import SVR
 from sklearn.neighbors import KNeighborsRegressor
 from sklearn.kernel_ridge import KernelRidge
-from sklearn.model_selection import GridSearchCV
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import (
+    GridSearchCV,
+    RandomizedSearchCV,
+    HalvingGridSearchCV,
+    HalvingRandomSearchCV,
+    KFold,
+)
 from sklearn.metrics import mean_absolute_percentage_error, make_scorer
 
 from joblib import parallel_backend
@@ -30,31 +45,125 @@ def activate_logging(logs_to_artifact):
         return logging.basicConfig(
             filename="logs.txt",
             level=logging.INFO,
+            force=True,
             format="LEARNING    %(message)s",
         )
     return logging.basicConfig(
         level=logging.INFO,
+        force=True,
         format="LEARNING    %(message)s",
         handlers=[RichHandler()],
     )
 
 
-def _make_pred_artifact(pred, test_y: pd.Series):
-    prediction = pd.concat([pd.Series(pred), test_y], axis=1)
-    prediction.columns = ["predicted", "measured"]
-    return prediction
+def _is_multi_target(nfp: str) -> bool:
+    return nfp == "all" or "," in nfp
+
+
+def _make_pred_artifact(predictions: dict, test_y: pd.DataFrame, multi_target: bool):
+    columns = {}
+    for target, pred in predictions.items():
+        suffix = f".{target}" if multi_target else ""
+        columns["predicted" + suffix] = pred
+        columns["measured" + suffix] = test_y[target].to_numpy()
+    return pd.DataFrame(columns)
 
 
-def _load_data(data_file: str, cache: CacheHandler, nfp: str):
-    data = cache.retrieve(data_file)
-    nfp = "nfp_" + nfp
-    columns_to_drop = [col for col in data.columns if "nfp_" in col and col != nfp]
-    data = data.drop(columns_to_drop, axis=1)
-    Y = data[nfp]
-    X = data.drop(nfp, axis=1)
+def _split_features(data: pd.DataFrame, nfp: str):
+    """
+    Returns the options and the nfps to learn, one column per nfp named
+    without prefix. nfp is a name, comma separated names or all.
+    """
+    nfps = [col for col in data.columns if "nfp_" in col]
+    if nfp == "all":
+        targets = [col for col in nfps if col.startswith("nfp_")]
+    else:
+        targets = ["nfp_" + name for name in nfp.split(",")]
+    Y = data[targets].rename(columns=lambda col: col[len("nfp_") :])
+    X = data.drop(nfps, axis=1)
     return X, Y
 
 
+def _load_data(sampling_run_id: str, nfp: str):
+    """
+    Returns train and test data of a sampling run. Index-only samples are
+    resolved against the measurements of their system run.
+    """
+    sampling_cache = CacheHandler(sampling_run_id, new_run=False)
+    tags = mlflow.get_run(sampling_run_id).data.tags
+    if tags.get(SAMPLE_ARTIFACT_TAG) != INDEX_SAMPLE:
+        train = sampling_cache.retrieve("train.feather")
+        test = sampling_cache.retrieve("test.feather")
+        return _split_features(train, nfp) + _split_features(test, nfp)
+
+    sample = sampling_cache.retrieve("sample.json")
+    system_cache = CacheHandler(sample["system_run_id"], new_run=False)
+    data = system_cache.retrieve("measurements.feather")
+    in_test = np.ones(len(data), dtype=bool)
+    in_test[sample["train"]] = False
+    return _split_features(data.iloc[sample["train"]], nfp) + _split_features(
+        data[in_test], nfp
+    )
+
+
+WARM_START_TAG = "warm_start_key"
+N_TRAIN_TAG = "n_train"
+
+# sampling params that do not distinguish related samples of different size
+_SAMPLE_SIZE_PARAMS = ["n", "logs_to_artifact", "artifact_format", "index_only"]
+
+
+def _warm_start_key(sampling_run_id: str, method: str, nfp: str):
+    """
+    Returns a key shared by learning runs on samples that only differ in size
+    and contain each other, i.e. seeded samples of batch sampling. Returns
+    None for other samples, smaller samples of them are unrelated.
+    """
+    sampling_run = mlflow.get_run(sampling_run_id).data
+    nested = sampling_run.tags.get(NESTED_SAMPLE_TAG)
+    if not nested:
+        return None
+    params = sampling_run.params
+    content = {k: v for k, v in params.items() if k not in _SAMPLE_SIZE_PARAMS}
+    content.update({"method": method, "nfp": nfp, "nested": nested})
+    return hashlib.sha256(
+        json.dumps(content, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def _previous_best_params(warm_start_key: str, n_train: int):
+    """
+    Returns the logged params of the finished learning run with the same key
+    and the largest sample smaller than n_train, None if there is none.
+    """
+    runs = mlflow.search_runs(
+        filter_string=f"tags.{WARM_START_TAG} = '{warm_start_key}'"
+        " AND attribute.status = 'FINISHED'"
+    )
+    if not runs.empty:
+        runs = runs[runs[f"tags.{N_TRAIN_TAG}"].astype(int) < n_train]
+    if runs.empty:
+        return None
+    previous = runs.loc[runs[f"tags.{N_TRAIN_TAG}"].astype(int).idxmax()]
+    logging.info(
+        "Warm start from run %s with %s samples.",
+        previous["run_id"],
+        previous[f"tags.{N_TRAIN_TAG}"],
+    )
+    return {
+        column[len("params.") :]: value
+        for column, value in previous.items()
+        if column.startswith("params.") and isinstance(value, str)
+    }
+
+
+def _target_params(params: dict, suffix: str) -> dict:
+    """returns the params logged for one nfp of a multi-target run"""
+    if not suffix:
+        return params
+    return {k[: -len(suffix)]: v for k, v in params.items() if k.endswith(suffix)}
+
+
 tuning_params = {
     "grid_search": {
         "svr": {
@@ -95,6 +204,15 @@ tuning_params = {
 }
 
 
+# all strategies search the same parameter space
+for strategy in [
+    "random_search",
+    "halving_grid_search",
+    "halving_random_search",
+]:
+    tuning_params[strategy] = tuning_params["grid_search"]
+
+
 def create_param_grid(tuning_strategy, method, n_features):
     param_space = tuning_params[tuning_strategy][method]
 
@@ -109,7 +227,67 @@ def create_param_grid(tuning_strategy, method, n_features):
     return param_space
 
 
-model_selection = {"grid_search": GridSearchCV}
+model_selection = {
+    "grid_search": GridSearchCV,
+    "random_search": RandomizedSearchCV,
+    "halving_grid_search": HalvingGridSearchCV,
+    "halving_random_search": HalvingRandomSearchCV,
+}
+
+# options of the strategies that only evaluate part of the candidates
+budget_options = {
+    "grid_search": lambda n_iter, seed: {},
+    "random_search": lambda n_iter, seed: {"n_iter": n_iter, "random_state": seed},
+    "halving_grid_search": lambda n_iter, seed: {"random_state": seed},
+    "halving_random_search": lambda n_iter, seed: {
+        "n_candidates": n_iter,
+        "random_state": seed,
+    },
+}
+
+# halving starts with 2 * k samples per fold and triples them per iteration
+HALVING_FACTOR = 3
+halving_fallbacks = {
+    "halving_grid_search": "grid_search",
+    "halving_random_search": "random_search",
+}
+
+
+def _create_selection(
+    tuning_strategy, model, param_space, cv, n_samples, n_iter, seed, sweep=False
+):
+    """
+    Returns the hyperparameter search. All strategies share the given
+    splitter, so halving strategies split the subsample of each iteration
+    like the other strategies split all n_samples samples.
+    With sweep, grid searches over n_estimators grow ensembles with warm_start.
+    """
+    k = cv.get_n_splits()
+    if tuning_strategy in halving_fallbacks and n_samples < 2 * k * HALVING_FACTOR:
+        logging.warning(
+            "Too few samples for %s, use %s.",
+            tuning_strategy,
+            halving_fallbacks[tuning_strategy],
+        )
+        tuning_strategy = halving_fallbacks[tuning_strategy]
+
+    scoring = make_scorer(mean_absolute_percentage_error, greater_is_better=False)
+    if sweep and tuning_strategy == "grid_search":
+        return EnsembleSweepSearch(model, param_space, cv, scoring, verbose=1)
+
+    options = budget_options[tuning_strategy](n_iter, seed)
+    if tuning_strategy in halving_fallbacks:
+        options["factor"] = HALVING_FACTOR
+
+    return model_selection[tuning_strategy](
+        model,
+        param_space,
+        n_jobs=-1,
+        verbose=1,
+        cv=cv,
+        scoring=scoring,
+        **options,
+    )
 
 
 estimators = {
@@ -122,6 +300,47 @@ estimators = {
 }
 
 
+# fitted attributes only used for fitting and out-of-bag estimates
+TRAINING_ATTRIBUTES = [
+    "_sample_weight",
+    "_seeds",
+    "oob_score_",
+    "oob_prediction_",
+    "oob_decision_function_",
+]
+
+
+def _strip(model):
+    """removes fitted attributes that predictions do not need"""
+    for attribute in TRAINING_ATTRIBUTES:
+        if attribute in vars(model):
+            delattr(model, attribute)
+    return model
+
+
+def _log_model(model, name: str, model_format: str, model_cache: CacheHandler):
+    """
+    Logs a learned model as mlflow model in directory name, or as compressed
+    joblib artifact model[.name].joblib. With model format none, nothing is
+    logged.
+    """
+    if model_format == "none":
+        return
+    model = _strip(model)
+    if model_format == "mlflow":
+        mlflow.sklearn.log_model(model, name)
+        return
+    model_file = f"model.{name}.joblib" if name else "model.joblib"
+    model_cache.save({model_file: model})
+    mlflow.log_artifact(os.path.join(model_cache.cache_dir, model_file), "")
+
+
+def _fit_search(selection, train_x, train_y, backend):
+    # the joblib backend is set per thread
+    with parallel_backend(backend):
+        return selection.fit(train_x, train_y)
+
+
 def MRE(y_true, y_pred):
     mre = mean_absolute_percentage_error(y_true, y_pred)
     return mre
@@ -139,12 +358,34 @@ def MRE(y_true, y_pred):
 @click.option("--nfp")
 @click.option("--tuning_strategy", type=str, default=None)
 @click.option("--logs_to_artifact", type=bool, default=False)
+@click.option(
+    "--artifact_format", type=click.Choice(["tsv", "feather"]), default="tsv"
+)
+@click.option("--n_iter", type=int, default=50)
+@click.option("--seed", type=int, default=None)
+@click.option(
+    "--backend", type=click.Choice(["threading", "loky"]), default="threading"
+)
+@click.option("--warm_start", type=bool, default=False)
+@click.option("--kernel_cache", type=bool, default=False)
+@click.option(
+    "--model_format",
+    type=click.Choice(["mlflow", "joblib", "none"]),
+    default="mlflow",
+)
 def learning(
     sampling_run_id: str = "",
     method: str = "cart",
     nfp: str = "",
     tuning_strategy: str = None,
     logs_to_artifact: bool = False,
+    artifact_format: str = "tsv",
+    n_iter: int = 50,
+    seed: int = None,
+    backend: str = "threading",
+    warm_start: bool = False,
+    kernel_cache: bool = False,
+    model_format: str = "mlflow",
 ):
     """
     Learning of influences of options on nfp
@@ -156,55 +397,130 @@ def learning(
     method : str
         learning method
     nfp : str
-        name of nfp
+        name of nfp, comma separated names or all. With more than one nfp,
+        all nfps are learned in one run and params, metrics, models and
+        predictions are suffixed with the name of the nfp
+    tuning_strategy : str
+        hyperparameter search, see model_selection
+    artifact_format : str
+        format of the predictions, tsv or feather
+    n_iter : int
+        number of candidates of random searches
+    seed : int
+        seed of randomized searches
+    backend : str
+        joblib backend of the search, loky runs candidates in processes
+    warm_start : bool
+        narrow the search to the neighbourhood of the parameters tuned on the
+        largest smaller sample of the same system, sampling method and seed,
+        and grow rf and bagging ensembles instead of refitting them
+    kernel_cache : bool
+        search svr and kr on cached Gram matrices, computed once per kernel
+    model_format : str
+        mlflow model, compressed joblib artifact or none to only log the
+        predictions
     """
     activate_logging(logs_to_artifact)
     logging.info("Start learning from sampled configurations.")
 
-    # load data
-    sampling_cache = CacheHandler(sampling_run_id, new_run=False)
-    train_x, train_y = _load_data("train.tsv", sampling_cache, nfp)
-    test_x, test_y = _load_data("test.tsv", sampling_cache, nfp)
-
-    # get model
-    model = estimators[method]()
+    # load data once for all nfps
+    train_x, train_y, test_x, test_y = _load_data(sampling_run_id, nfp)
+    multi_target = _is_multi_target(nfp)
+    suffixes = {
+        target: f".{target}" if multi_target else "" for target in train_y.columns
+    }
 
     # get parameter space
     param_space = create_param_grid(tuning_strategy, method, len(train_x.columns))
+    warm_start_key = None
+    best_params = None
+    if warm_start:
+        warm_start_key = _warm_start_key(sampling_run_id, method, nfp)
+        if warm_start_key:
+            best_params = _previous_best_params(warm_start_key, len(train_x))
+        else:
+            logging.warning("No warm start, the sample is not from batch sampling.")
 
     # check if 10 features are available, elsewise use 9-fold cross validation
     k = 10 if len(train_x) > 10 else 9
-
-    # generate experiment
-    selection = model_selection[tuning_strategy](
-        model,
-        param_space,
-        n_jobs=-1,
-        verbose=1,
-        cv=k,
-        scoring=make_scorer(mean_absolute_percentage_error, greater_is_better=False),
-    )
+    # unshuffled, so all nfps and strategies are evaluated on the same folds
+    cv = KFold(n_splits=k)
+
+    # generate experiments, one per nfp
+    selections = {}
+    for target, suffix in suffixes.items():
+        model = estimators[method]()
+        if kernel_cache and method in precomputed_estimators:
+            # nfps share the data, so they share the cached kernel matrices
+            model = precomputed_estimators[method](data=gram_data(train_x))
+        target_space = param_space
+        if best_params:
+            target_space = narrow_param_space(
+                param_space, _target_params(best_params, suffix)
+            )
+        selections[target] = _create_selection(
+            tuning_strategy,
+            model,
+            target_space,
+            cv,
+            len(train_x),
+            n_iter,
+            seed,
+            sweep=warm_start and method in SWEEPABLE,
+        )
+        if kernel_cache and method in precomputed_estimators:
+            selections[target] = PrecomputedKernelSearch(
+                selections[target], estimators[method]()
+            )
 
     with mlflow.start_run() as run:
         try:
             model_cache = CacheHandler(run.info.run_id)
-            logging.info("Start hyperparam search using: %s", str(param_space))
+            mlflow.set_tag(N_TRAIN_TAG, len(train_x))
+            mlflow.log_param("cv", repr(cv))
+            if warm_start_key:
+                mlflow.set_tag(WARM_START_TAG, warm_start_key)
+            logging.info(
+                "Start hyperparam search for %s using: %s",
+                ", ".join(selections),
+                str(param_space),
+            )
             start = time.perf_counter_ns()
 
-            with parallel_backend("threading"):
-                selection.fit(train_x, train_y)
+            with ThreadPoolExecutor(max_workers=len(selections)) as executor:
+                list(
+                    executor.map(
+                        _fit_search,
+                        selections.values(),
+                        repeat(train_x),
+                        [train_y[target] for target in selections],
+                        repeat(backend),
+                    )
+                )
             end = time.perf_counter_ns()
             mlflow.log_metric("learning_time", (end - start) * 0.000000001)
-            mlflow.sklearn.log_model(selection.best_estimator_, "")
-            mlflow.log_params(selection.best_params_)
-            mlflow.log_metric("best_score", selection.best_score_)
+
+            predictions = {}
+            for target, selection in selections.items():
+                suffix = suffixes[target]
+                mlflow.log_params(
+                    {name + suffix: v for name, v in selection.best_params_.items()}
+                )
+                mlflow.log_metric("best_score" + suffix, selection.best_score_)
+                predictions[target] = selection.best_estimator_.predict(test_x)
+                _log_model(
+                    selection.best_estimator_,
+                    target if multi_target else "",
+                    model_format,
+                    model_cache,
+                )
+
             logging.info("Predict on test set and save to cache.")
-            prediction = _make_pred_artifact(
-                selection.best_estimator_.predict(test_x), test_y
-            )
-            model_cache.save({"predicted.tsv": prediction})
+            prediction = _make_pred_artifact(predictions, test_y, multi_target)
+            prediction_file = f"predicted.{artifact_format}"
+            model_cache.save({prediction_file: prediction})
             mlflow.log_artifact(
-                os.path.join(model_cache.cache_dir, "predicted.tsv"), ""
+                os.path.join(model_cache.cache_dir, prediction_file), ""
             )
 
         except Exception as e:
@@ -1,4 +1,5 @@
 import sys
+import numpy as np
 import pandas as pd
 from rich.logging import RichHandler
 import logging
@@ -6,20 +7,104 @@ import mlflow
 import click
 from sklearn.model_selection import train_test_split
 from caching import CacheHandler
+from indexing import configuration_ids, lookup
+from structured_sampling import FeatureFormula, binary_samplers, sample_configurations
+from tags import SAMPLE_ARTIFACT_TAG, INDEX_SAMPLE
 
 
-def _split_dataset_by_samples(data, samples):
-    data = data.merge(samples, on=list(samples.columns), how="left", indicator=True)
-    train = data[data["_merge"] == "both"].drop("_merge", axis=1)
-    test = data[data["_merge"] == "left_only"].drop("_merge", axis=1)
+def true_random_sampling(n: int, all_configs: pd.DataFrame):
+    """
+    Returns the rows of the sampled and remaining configurations.
+    """
+    train, test = train_test_split(np.arange(len(all_configs)), train_size=n)
+
     return train, test
 
 
-def true_random_sampling(n: int, all_configs: pd.DataFrame):
+def _load_index(system_cache: CacheHandler, data: pd.DataFrame, features: dict):
+    try:
+        return system_cache.retrieve("index.feather")["config_id"].to_numpy()
+    except Exception:
+        logging.info("System run has no index, index configurations...")
+        return configuration_ids(data, features["binary"], features["numeric"])
 
-    train, test = train_test_split(all_configs, train_size=n)
 
-    return train, test
+def _measured_rows(
+    configs: pd.DataFrame,
+    data: pd.DataFrame,
+    index_ids,
+    features,
+    always_selected: list = (),
+):
+    """
+    Returns the rows of the sampled configurations that were measured
+    and the sampled configurations that were not measured. Configurations
+    that select an option which no measurement selects are not measured.
+    """
+    sampled = configs
+    configs = configs.copy()
+    for option in always_selected:
+        # measurements may omit options that are always selected, e.g. abstract ones
+        values = data[option].unique()
+        if len(values) == 1:
+            configs[option] = values[0]
+
+    if all(option in configs.columns for option in features["numeric"]):
+        rows = lookup(
+            index_ids,
+            configuration_ids(configs, features["binary"], features["numeric"]),
+        )
+        measured = rows >= 0
+        rows = pd.unique(rows[measured])
+    else:
+        # numeric options were not sampled, use all of their measured values
+        sample_ids = configuration_ids(configs, features["binary"], [])
+        data_ids = configuration_ids(data, features["binary"], [])
+        measured = np.isin(sample_ids, data_ids)
+        rows = np.flatnonzero(np.isin(data_ids, sample_ids))
+
+    logging.info(
+        "%i of %i sampled configurations were measured.", measured.sum(), len(configs)
+    )
+    return rows, sampled[~measured]
+
+
+def structured_sampling(
+    method: str, system_cache: CacheHandler, data: pd.DataFrame, **params
+):
+    """
+    Samples configurations from the feature model of the system. Returns the
+    rows of the measured and remaining configurations, and the sampled
+    configurations that were not measured.
+    """
+    dimacs, features = system_cache.retrieve(["fm.dimacs", "features.json"])
+    formula = FeatureFormula.from_dimacs(dimacs)
+    numeric_values = {option: data[option].unique() for option in features["numeric"]}
+    configs = sample_configurations(
+        formula,
+        method,
+        numeric_values=numeric_values,
+        **params,
+    )
+    constant = [option for option in formula.names if data[option].nunique() == 1]
+    train, unmeasured = _measured_rows(
+        configs,
+        data,
+        _load_index(system_cache, data, features),
+        features,
+        formula.core(constant),
+    )
+    in_test = np.ones(len(data), dtype=bool)
+    in_test[train] = False
+    return train, np.flatnonzero(in_test), unmeasured
+
+
+def _sample_artifact(system_run_id: str, train) -> dict:
+    """
+    Returns the index-only artifact of a sample. All configurations
+    of the system that are not in train are used for testing.
+    """
+    return {"system_run_id": system_run_id, "train": [int(row) for row in train]}
 
 
 def activate_logging(logs_to_artifact):
@@ -27,10 +112,12 @@ def activate_logging(logs_to_artifact):
         return logging.basicConfig(
             filename="logs.txt",
             level=logging.INFO,
+            force=True,
             format="SAMPLING    %(message)s",
         )
     return logging.basicConfig(
         level=logging.INFO,
+        force=True,
         format="SAMPLING    %(message)s",
         handlers=[RichHandler()],
     )
@@ -41,8 +128,25 @@ def activate_logging(logs_to_artifact):
 @click.option("--method", default=None)
 @click.option("--n", default=10, type=int)
 @click.option("--logs_to_artifact", type=bool, default=False)
+@click.option(
+    "--artifact_format", type=click.Choice(["tsv", "feather"]), default="tsv"
+)
+@click.option("--index_only", type=bool, default=False)
+@click.option("--numeric_method", default="")
+@click.option("--t", type=int, default=2)
+@click.option("--levels", type=int, default=3)
+@click.option("--seed", type=int, default=None)
 def sample(
-    method: str, n: int = 10, system_run_id: str = "", logs_to_artifact: bool = False
+    method: str,
+    n: int = 10,
+    system_run_id: str = "",
+    logs_to_artifact: bool = False,
+    artifact_format: str = "tsv",
+    index_only: bool = False,
+    numeric_method: str = "",
+    t: int = 2,
+    levels: int = 3,
+    seed: int = None,
 ):
     """
     Samples valid configurations from a variability model.
@@ -50,11 +154,25 @@ def sample(
     Parameters
     ----------
     n: int
-        number of samples
+        number of samples, for random and distance-based sampling
     method: str
-        method for sampling
+        method for sampling, random or a sampler of binary options:
+        featurewise, pairwise, twise, distance-based, diversified or uniform
     system_run_id : str
         run of system loading
+    artifact_format : str
+        format of the sampled configurations, tsv or feather
+    index_only : bool
+        only store the rows of the sampled configurations in the measurements
+        of the system run instead of copies of the configurations
+    numeric_method : str
+        method for sampling numeric options, plackett-burman
+    t : int
+        strength of t-wise sampling
+    levels : int
+        number of levels of the Plackett-Burman design, a prime number
+    seed : int
+        seed of distance-based, diversified and uniform sampling
     """
     activate_logging(logs_to_artifact)
 
@@ -63,24 +181,50 @@ def sample(
     with mlflow.start_run() as run:
         sampling_cache = CacheHandler(run.info.run_id)
         system_cache = CacheHandler(system_run_id, new_run=False)
-        data = system_cache.retrieve("measurements.tsv")
+        data = system_cache.retrieve("measurements.feather")
         logging.info("Sampling using '%s'.", method)
-        logging.warning(
-            "Only use this method when all valid configurations are available."
-        )
+        unmeasured = None
         if method == "random":
+            logging.warning(
+                "Only use this method when all valid configurations are available."
+            )
             train, test = true_random_sampling(int(n), all_configs=data)
+        elif method in binary_samplers:
+            train, test, unmeasured = structured_sampling(
+                method,
+                system_cache,
+                data,
+                numeric_method=numeric_method,
+                n=int(n),
+                t=t,
+                levels=levels,
+                seed=seed,
+            )
         else:
             logging.error("Method not found, exiting...")
             sys.exit(1)
 
+        if unmeasured is not None and len(unmeasured):
+            # valid configurations to measure for partially measured systems
+            sampling_cache.save({f"unmeasured.{artifact_format}": unmeasured})
+        if not len(train):
+            # the unmeasured configurations are kept, so they can be measured
+            mlflow.log_artifacts(sampling_cache.cache_dir, "")
+            raise ValueError(
+                f"None of the configurations sampled with {method} was measured."
+            )
+
         logging.info("Save sampled configurations to cache")
-        sampling_cache.save(
-            {
-                "train.tsv": train,
-                "test.tsv": test,
-            }
-        )
+        if index_only:
+            mlflow.set_tag(SAMPLE_ARTIFACT_TAG, INDEX_SAMPLE)
+            sampling_cache.save({"sample.json": _sample_artifact(system_run_id, train)})
+        else:
+            sampling_cache.save(
+                {
+                    f"train.{artifact_format}": data.iloc[train],
+                    f"test.{artifact_format}": data.iloc[test],
+                }
+            )
         logging.info("Sampling cache dir: %s", sampling_cache.cache_dir)
         mlflow.log_artifacts(sampling_cache.cache_dir, "")
         if logs_to_artifact:
@@ -0,0 +1,410 @@
+"""
+Samplers that derive configurations from the feature model of a system,
+i.e. from the fm.dimacs artifact of the systems step.
+"""
+import itertools
+import logging
+import numpy as np
+import pandas as pd
+import pycryptosat
+from pysat.solvers import Solver
+from pysat.card import CardEnc
+
+SOLVER = "m22"
+
+
+class FeatureFormula:
+    """
+    CNF of the binary options of a feature model.
+
+    ...
+
+    Attributes
+    ----------
+    names : list
+        names of the binary options, option i is variable i + 1
+    clauses : list
+        clauses of the formula
+
+    Methods
+    -------
+    from_dimacs(dimacs):
+        parses the dimacs representation generated by the systems step
+    solver(clauses):
+        returns a SAT solver initialized with the formula
+    to_array(model):
+        returns a solver model as 0/1 vector of the options
+    core(names):
+        returns the options that every valid configuration selects
+    """
+
+    def __init__(self, names: list, clauses: list):
+        self.names = names
+        self.clauses = clauses
+
+    @classmethod
+    def from_dimacs(cls, dimacs: str):
+        """parses the dimacs representation generated by the systems step"""
+        names, clauses = {}, []
+        for line in dimacs.splitlines():
+            tokens = line.split()
+            if not tokens or tokens[0] == "p":
+                continue
+            if tokens[0] == "c":
+                names[int(tokens[1])] = " ".join(tokens[2:])
+            else:
+                clauses.append([int(literal) for literal in tokens[:-1]])
+        return cls([names[i] for i in sorted(names)], clauses)
+
+    @property
+    def n_vars(self) -> int:
+        return len(self.names)
+
+    def solver(self, clauses: list = None):
+        """returns a SAT solver initialized with the formula"""
+        return Solver(name=SOLVER, bootstrap_with=self.clauses + (clauses or []))
+
+    def to_array(self, model: list):
+        """returns a solver model as 0/1 vector of the options"""
+        config = np.zeros(self.n_vars, dtype=np.uint8)
+        literals = np.asarray(model, dtype=np.int64)
+        literals = literals[(literals > 0) & (literals <= self.n_vars)]
+        config[literals - 1] = 1
+        return config
+
+    def core(self, names: list = None) -> list:
+        """returns the options that every valid configuration selects"""
+        names = self.names if names is None else names
+        with self.solver() as solver:
+            return [
+                name
+                for name in names
+                if not solver.solve(assumptions=[-(self.names.index(name) + 1)])
+            ]
+
+
+def _unique_rows(configs: list, n_vars: int):
+    unique = {config.tobytes(): config for config in configs}
+    if not unique:
+        return np.zeros((0, n_vars), dtype=np.uint8)
+    return np.stack(list(unique.values()))
+
+
+def featurewise(formula: FeatureFormula, **_):
+    """
+    Returns one valid configuration per option, selecting the option and
+    as few other options as the solver finds.
+    """
+    configs = []
+    with formula.solver() as solver:
+        solver.set_phases([-var for var in range(1, formula.n_vars + 1)])
+        for var in range(1, formula.n_vars + 1):
+            if solver.solve(assumptions=[var]):
+                configs.append(formula.to_array(solver.get_model()))
+            else:
+                name = formula.names[var - 1]
+                logging.warning("Option %s can not be selected.", name)
+    return _unique_rows(configs, formula.n_vars)
+
+
+def _interactions(n_vars: int, t: int):
+    combinations = np.array(
+        list(itertools.combinations(range(1, n_vars + 1), t)), dtype=np.int64
+    ).reshape(-1, t)
+    signs = np.array(list(itertools.product([1, -1], repeat=t)), dtype=np.int64)
+    return (combinations[:, None, :] * signs[None, :, :]).reshape(-1, t)
+
+
+def _covered(interactions, config):
+    return (config[np.abs(interactions) - 1] == (interactions > 0)).all(axis=1)
+
+
+def twise(formula: FeatureFormula, t: int = 2, max_trials: int = 100, **_):
+    """
+    Returns valid configurations covering all valid combinations of t options
+    being selected or deselected. Configurations are built greedily: the first
+    uncovered interaction is extended with further uncovered interactions as
+    long as the formula stays satisfiable.
+
+    Parameters
+    ----------
+    t : int
+        strength of the interactions, 2 for pairwise sampling
+    max_trials : int
+        number of unsatisfiable extensions after which a configuration is final
+    """
+    interactions = _interactions(formula.n_vars, t)
+    uncovered = np.ones(len(interactions), dtype=bool)
+    configs = []
+    with formula.solver() as solver:
+        while uncovered.any():
+            candidates = np.flatnonzero(uncovered)
+            assumptions = set(interactions[candidates[0]].tolist())
+            if not solver.solve(assumptions=list(assumptions)):
+                # invalid interaction, no configuration can cover it
+                uncovered[candidates[0]] = False
+                continue
+
+            config = formula.to_array(solver.get_model())
+            trials = 0
+            for candidate in candidates[1:]:
+                if trials >= max_trials:
+                    break
+                literals = interactions[candidate].tolist()
+                if any(-literal in assumptions for literal in literals) or _covered(
+                    interactions[candidate : candidate + 1], config
+                )[0]:
+                    continue
+                if solver.solve(assumptions=list(assumptions.union(literals))):
+                    assumptions.update(literals)
+                    config = formula.to_array(solver.get_model())
+                else:
+                    trials += 1
+
+            configs.append(config)
+            uncovered &= ~_covered(interactions, config)
+    return _unique_rows(configs, formula.n_vars)
+
+
+def _random_phases(solver, n_vars: int, rng):
+    signs = rng.choice([-1, 1], size=n_vars)
+    solver.set_phases((signs * np.arange(1, n_vars + 1)).tolist())
+
+
+def _blocking_clause(config):
+    return [-(i + 1) if selected else i + 1 for i, selected in enumerate(config)]
+
+
+def distance_based(formula: FeatureFormula, n: int = 10, seed: int = None, **_):
+    """
+    Returns n valid configurations whose numbers of selected options are
+    distributed uniformly. Configurations are drawn with random phases and
+    blocked once found.
+
+    Parameters
+    ----------
+    n : int
+        number of configurations
+    seed : int
+        seed of the random number generator
+    """
+    rng = np.random.default_rng(seed)
+    variables = list(range(1, formula.n_vars + 1))
+    distances = list(range(formula.n_vars + 1))
+    solvers = {}
+    configs = []
+    try:
+        while len(configs) < n and distances:
+            distance = distances[rng.integers(len(distances))]
+            if distance not in solvers:
+                cardinality = CardEnc.equals(
+                    lits=variables, bound=distance, top_id=formula.n_vars
+                )
+                solvers[distance] = formula.solver(cardinality.clauses)
+            solver = solvers[distance]
+
+            _random_phases(solver, formula.n_vars, rng)
+            if not solver.solve():
+                distances.remove(distance)
+                continue
+            config = formula.to_array(solver.get_model())
+            configs.append(config)
+            solver.add_clause(_blocking_clause(config))
+    finally:
+        for solver in solvers.values():
+            solver.delete()
+
+    if len(configs) < n:
+        logging.warning("Only %i valid configurations exist.", len(configs))
+    return np.stack(configs) if configs else np.zeros((0, formula.n_vars), np.uint8)
+
+
+def diversified(formula: FeatureFormula, n: int = 10, seed: int = None, **_):
+    """
+    Returns n distinct valid configurations, drawn with random phases from
+    one incremental solver. Found configurations are blocked, so the solver
+    is pushed to other regions of the configuration space.
+
+    Parameters
+    ----------
+    n : int
+        number of configurations
+    seed : int
+        seed of the random number generator
+    """
+    rng = np.random.default_rng(seed)
+    configs = []
+    with formula.solver() as solver:
+        while len(configs) < n:
+            _random_phases(solver, formula.n_vars, rng)
+            if not solver.solve():
+                logging.warning("Only %i valid configurations exist.", len(configs))
+                break
+            configs.append(formula.to_array(solver.get_model()))
+            solver.add_clause(_blocking_clause(configs[-1]))
+    return _unique_rows(configs, formula.n_vars)
+
+
+def _cell(formula: FeatureFormula, n_hashes: int, blocked: list, pivot: int, rng):
+    """
+    Returns up to pivot + 1 valid configurations that satisfy n_hashes random
+    XOR constraints over the options. CryptoMiniSat handles XOR constraints
+    natively with Gaussian elimination, CDCL solvers on their CNF encoding do
+    not scale to the number of constraints large feature models need.
+    """
+    solver = pycryptosat.Solver()
+    solver.add_clauses(formula.clauses + blocked)
+    for _ in range(n_hashes):
+        variables = np.flatnonzero(rng.random(formula.n_vars) < 0.5) + 1
+        parity = bool(rng.integers(2))
+        if len(variables):
+            solver.add_xor_clause(variables.tolist(), parity)
+        elif parity:
+            return []
+
+    cell = []
+    while len(cell) <= pivot:
+        satisfiable, solution = solver.solve()
+        if not satisfiable:
+            break
+        config = np.zeros(formula.n_vars, dtype=np.uint8)
+        values = solution[1 : formula.n_vars + 1]
+        config[: len(values)] = [bool(value) for value in values]
+        cell.append(config)
+        solver.add_clause(_blocking_clause(config))
+    return cell
+
+
+def uniform(
+    formula: FeatureFormula, n: int = 10, seed: int = None, pivot: int = 16, **_
+):
+    """
+    Returns n distinct valid configurations sampled near-uniformly with
+    random XOR constraints. Each XOR constraint halves the solution space in
+    expectation. The number of XOR constraints is chosen so that a cell holds
+    at most pivot configurations, which are enumerated incrementally and of
+    which one is drawn uniformly. The number is found by bisection once and
+    adapted for later samples.
+
+    Parameters
+    ----------
+    n : int
+        number of configurations
+    seed : int
+        seed of the random number generator
+    pivot : int
+        maximal number of configurations in a cell
+    """
+    rng = np.random.default_rng(seed)
+
+    lower, upper = 0, formula.n_vars
+    while lower < upper:
+        middle = (lower + upper) // 2
+        if len(_cell(formula, middle, [], pivot, rng)) > pivot:
+            lower = middle + 1
+        else:
+            upper = middle
+
+    n_hashes = lower
+    blocked = []
+    configs = []
+    while len(configs) < n:
+        cell = _cell(formula, n_hashes, blocked, pivot, rng)
+        if len(cell) > pivot:
+            n_hashes += 1
+        elif cell:
+            configs.append(cell[rng.integers(len(cell))])
+            blocked.append(_blocking_clause(configs[-1]))
+        elif n_hashes:
+            n_hashes -= 1
+        else:
+            logging.warning("Only %i valid configurations exist.", len(configs))
+            break
+    return _unique_rows(configs, formula.n_vars)
+
+
+binary_samplers = {
+    "featurewise": featurewise,
+    "pairwise": lambda formula, **params: twise(formula, **dict(params, t=2)),
+    "twise": twise,
+    "distance-based": distance_based,
+    "diversified": diversified,
+    "uniform": uniform,
+}
+
+
+def _is_prime(number: int) -> bool:
+    return number > 1 and all(number % i for i in range(2, int(number**0.5) + 1))
+
+
+def plackett_burman(values: dict, levels: int = 3, **_):
+    """
+    Returns a Plackett-Burman design for numeric options. The design is the
+    orthogonal array of strength 2 from the Rao-Hamming construction, with
+    levels^k runs for the smallest k that provides enough columns.
+
+    Parameters
+    ----------
+    values : dict[str, list]
+        the values each numeric option can take
+    levels : int
+        prime number of levels per option
+    """
+    if not _is_prime(levels):
+        raise ValueError("Plackett-Burman designs need a prime number of levels.")
+    if not values:
+        return pd.DataFrame(index=[0])
+
+    k = 1
+    while (levels**k - 1) // (levels - 1) < len(values):
+        k += 1
+    vectors = np.array(list(itertools.product(range(levels), repeat=k)))
+    # columns: nonzero vectors whose first nonzero entry is one
+    columns = np.array(
+        [v for v in vectors if v.any() and v[np.flatnonzero(v)[0]] == 1]
+    )[: len(values)]
+    design = vectors @ columns.T % levels
+
+    data = {}
+    for i, (option, option_values) in enumerate(values.items()):
+        option_values = np.sort(np.unique(option_values))
+        positions = np.round(
+            np.arange(levels) * (len(option_values) - 1) / (levels - 1)
+        ).astype(int)
+        data[option] = option_values[positions][design[:, i]]
+    return pd.DataFrame(data).drop_duplicates(ignore_index=True)
+
+
+numeric_samplers = {"plackett-burman": plackett_burman}
+
+
+def sample_configurations(
+    formula: FeatureFormula,
+    method: str,
+    numeric_values: dict = None,
+    numeric_method: str = None,
+    **params,
+) -> pd.DataFrame:
+    """
+    Returns the cross product of the sampled binary and numeric configurations.
+
+    Parameters
+    ----------
+    formula : FeatureFormula
+        formula of the binary options
+    method : str
+        sampler of binary options, see binary_samplers
+    numeric_values : dict[str, list]
+        the values each numeric option can take
+    numeric_method : str
+        sampler of numeric options, see numeric_samplers
+    """
+    binary = pd.DataFrame(
+        binary_samplers[method](formula, **params), columns=formula.names
+    )
+    if not formula.n_vars:
+        binary = pd.DataFrame(index=[0])
+    if not numeric_method:
+        return binary
+    numeric = numeric_samplers[numeric_method](numeric_values, **params)
+    return binary.merge(numeric, how="cross")
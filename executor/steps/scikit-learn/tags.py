@@ -0,0 +1 @@
+../common/tags.py
\ No newline at end of file
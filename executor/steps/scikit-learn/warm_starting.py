@@ -0,0 +1,126 @@
+"""
+Reuse of work across fits: hyperparameters tuned on smaller samples narrow
+the search on larger ones, and ensembles are grown instead of refitted for
+every number of estimators.
+"""
+import numbers
+import logging
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.model_selection import ParameterGrid, check_cv
+
+# estimators whose n_estimators can be swept with warm_start
+SWEEPABLE = ["rf", "bagging"]
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+
+def narrow_param_space(param_space: dict, best_params: dict) -> dict:
+    """
+    Returns the parameter space around previously tuned values. Numeric
+    parameters keep the best value and its neighbours in sorted order, other
+    parameters only the best value. Parameters without a previous value are
+    searched completely.
+
+    Parameters
+    ----------
+    param_space : dict[str, list]
+        the complete parameter space
+    best_params : dict[str, str]
+        best parameters of a previous run, as logged to mlflow
+    """
+    narrowed = {}
+    for name, values in param_space.items():
+        matches = [value for value in values if str(value) == best_params.get(name)]
+        if not matches:
+            narrowed[name] = values
+        elif all(_is_number(value) for value in values):
+            ordered = sorted(set(values))
+            i = ordered.index(matches[0])
+            narrowed[name] = ordered[max(0, i - 1) : i + 2]
+        else:
+            narrowed[name] = matches[:1]
+    return narrowed
+
+
+def _fit_sweep(estimator, params, sizes, X, y, train, test, scorer):
+    model = clone(estimator).set_params(**clone(params, safe=False), warm_start=True)
+    scores = []
+    for size in sizes:
+        # only the estimators added to the ensemble are fitted
+        model.set_params(n_estimators=size).fit(X[train], y[train])
+        scores.append(scorer(model, X[test], y[test]))
+    return scores
+
+
+class EnsembleSweepSearch:
+    """
+    Grid search for ensembles that grows one ensemble per candidate of the
+    other parameters and fold with warm_start, scoring it at every number of
+    estimators of the grid. Exposes the results like GridSearchCV.
+
+    ...
+
+    Attributes
+    ----------
+    best_params_ : dict
+        parameters of the best candidate
+    best_score_ : float
+        mean score of the best candidate over all folds
+    best_estimator_ : estimator
+        the best candidate, refitted on all data
+
+    Methods
+    -------
+    fit(X, y):
+        searches the grid and refits the best candidate
+    """
+
+    def __init__(self, estimator, param_grid, cv, scoring, n_jobs=-1, verbose=0):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.cv = cv
+        self.scoring = scoring
+        self.n_jobs = n_jobs
+        self.verbose = verbose
+
+    def fit(self, X, y):
+        """searches the grid and refits the best candidate"""
+        sizes = sorted(set(self.param_grid["n_estimators"]))
+        candidates = list(
+            ParameterGrid(
+                {k: v for k, v in self.param_grid.items() if k != "n_estimators"}
+            )
+        )
+        logging.info(
+            "Grow %i ensembles per fold up to %i estimators.",
+            len(candidates),
+            sizes[-1],
+        )
+        values, targets = np.asarray(X), np.asarray(y)
+        folds = list(check_cv(self.cv).split(values, targets))
+        scorer = self.scoring
+        scores = Parallel(n_jobs=self.n_jobs, verbose=self.verbose)(
+            delayed(_fit_sweep)(
+                self.estimator, params, sizes, values, targets, train, test, scorer
+            )
+            for params in candidates
+            for train, test in folds
+        )
+        # candidates x sizes, averaged over folds
+        scores = np.asarray(scores).reshape(len(candidates), len(folds), len(sizes))
+        means = scores.mean(axis=1)
+        best_candidate, best_size = np.unravel_index(np.argmax(means), means.shape)
+
+        self.best_params_ = dict(
+            candidates[best_candidate], n_estimators=sizes[best_size]
+        )
+        self.best_score_ = means[best_candidate, best_size]
+        self.best_estimator_ = clone(self.estimator).set_params(
+            **clone(self.best_params_, safe=False)
+        )
+        self.best_estimator_.fit(X, y)
+        return self
@@ -0,0 +1 @@
+../common/indexing.py
\ No newline at end of file
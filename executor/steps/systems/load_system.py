@@ -4,6 +4,7 @@ Takes local data and saves it as artifacts
 import logging
 import os
 import sys
+import hashlib
 import mlflow
 import click
 import yaml
@@ -12,7 +13,8 @@ from rich.logging import RichHandler
 
 from modeling import FeatureModel
 from transformations import Measurements
-from caching import CacheHandler
+from caching import CacheHandler, cache_root
+from indexing import configuration_ids, index_frame
 
 logging.basicConfig(
     level=logging.INFO,
@@ -23,6 +25,18 @@ logging.basicConfig(
 
 mlflow.set_experiment("systems")
 
+# input files and the parameters their checksums are logged as
+INPUT_FILES = {
+    "fm.xml": "fm_sha256",
+    "measurements.xml": "measurements_sha256",
+    "meta.yaml": "meta_sha256",
+}
+
+# version of the generated artifacts, increase it whenever parsing or encoding
+# changes so that artifacts of earlier imports are not reused
+IMPORT_VERSION = "2"
+IMPORT_VERSION_PARAM = "import_version"
+
 
 def _check_mandatory_files(data_dir: str):
     files = os.listdir(data_dir)
@@ -43,6 +57,37 @@ def _check_measurement_files(data_dir: str):
         sys.exit(1)
 
 
+def _file_checksum(filename: str) -> str:
+    checksum = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1024**2), b""):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def _validated_checksums() -> set:
+    registry = os.path.join(cache_root(), ".validated")
+    if not os.path.exists(registry):
+        return set()
+    with open(registry, "r", encoding="utf-8") as f:
+        return set(f.read().split())
+
+
+def _record_validated(checksums):
+    with open(os.path.join(cache_root(), ".validated"), "a", encoding="utf-8") as f:
+        f.write("".join(checksum + "\n" for checksum in checksums))
+
+
+def _previous_checksums(previous_run_id: str) -> dict:
+    if not previous_run_id:
+        return {}
+    params = mlflow.get_run(previous_run_id).data.params
+    if params.get(IMPORT_VERSION_PARAM) != IMPORT_VERSION:
+        logging.info("Run %s was imported by another version.", previous_run_id)
+        return {}
+    return {name: params.get(param) for name, param in INPUT_FILES.items()}
+
+
 def _check_dir_content(data_dir: str):
     if not os.path.exists(data_dir):
         logging.error("Path %s does not exist. \nExiting...", data_dir)
@@ -54,7 +99,14 @@ def _check_dir_content(data_dir: str):
 @click.command(help="Imports feature model and measurement data.")
 @click.option("--data_dir")
 @click.option("--logs_to_artifact", type=bool, default=False)
-def load_system(data_dir: str, logs_to_artifact: bool = False):
+@click.option("--trusted", type=bool, default=False)
+@click.option("--previous_run_id", default="")
+def load_system(
+    data_dir: str,
+    logs_to_artifact: bool = False,
+    trusted: bool = False,
+    previous_run_id: str = "",
+):
     """
     Loads, validates, and transforms data of system.
 
@@ -65,20 +117,68 @@ def load_system(data_dir: str, logs_to_artifact: bool = False):
         - meta.yaml
         - fm.xml
         - measurements.xml or measurements.tsv
+    trusted : bool
+        Skip validation of xml files that were already validated before,
+        identified by their checksum.
+    previous_run_id : str
+        Earlier run of the same system. Artifacts whose input files did not
+        change since this run are reused instead of parsed again, if the run
+        was imported by the same version.
     """
 
     _check_dir_content(data_dir)
     with open(os.path.join(data_dir, "meta.yaml"), "r", encoding="utf-8") as f:
         params = yaml.safe_load(f)
 
-    logging.info("Load feature model...")
-    feature_model = FeatureModel(os.path.join(data_dir, "fm.xml"))
+    checksums = {
+        name: _file_checksum(os.path.join(data_dir, name)) for name in INPUT_FILES
+    }
+    previous = _previous_checksums(previous_run_id)
+    unchanged = [name for name in checksums if previous.get(name) == checksums[name]]
+    previous_cache = (
+        CacheHandler(previous_run_id, new_run=False) if previous_run_id else None
+    )
+    validated = _validated_checksums() if trusted else set()
+    parsed = []
+
+    if "fm.xml" in unchanged:
+        logging.info("Reuse feature model of run %s...", previous_run_id)
+        fm_xml, dimacs, features = previous_cache.retrieve(
+            ["fm.xml", "fm.dimacs", "features.json"]
+        )
+    else:
+        logging.info("Load feature model...")
+        feature_model = FeatureModel(
+            os.path.join(data_dir, "fm.xml"),
+            validate=checksums["fm.xml"] not in validated,
+        )
+        fm_xml = feature_model.xml
+        dimacs = feature_model.dimacs
+        features = feature_model.get_features()
+        parsed.append("fm.xml")
+
+    if "measurements.xml" in unchanged and features == previous_cache.retrieve(
+        "features.json"
+    ):
+        logging.info("Reuse measurements of run %s...", previous_run_id)
+        measurements = previous_cache.retrieve("measurements.tsv")
+    else:
+        logging.info("Load and transform measurements...")
+        measurements = Measurements(
+            os.path.join(data_dir, "measurements.xml"),
+            features["binary"],
+            features["numeric"],
+            validate=checksums["measurements.xml"] not in validated,
+        ).df
+        parsed.append("measurements.xml")
+
+    _record_validated(
+        checksums[name] for name in parsed if checksums[name] not in validated
+    )
 
-    logging.info("Load and transform measurements...")
-    measurements = Measurements(
-        os.path.join(data_dir, "measurements.xml"),
-        feature_model.binary,
-        feature_model.numeric,
+    logging.info("Index configurations...")
+    index = index_frame(
+        configuration_ids(measurements, features["binary"], features["numeric"])
     )
 
     with mlflow.start_run() as run:
@@ -86,10 +186,12 @@ def load_system(data_dir: str, logs_to_artifact: bool = False):
         cache = CacheHandler(run.info.run_id)
         cache.save(
             {
-                "fm.xml": feature_model.xml,
-                "fm.dimacs": feature_model.dimacs,
-                "features.json": feature_model.get_features(),
-                "measurements.tsv": measurements.df,
+                "fm.xml": fm_xml,
+                "fm.dimacs": dimacs,
+                "features.json": features,
+                "measurements.tsv": measurements,
+                "measurements.feather": measurements,
+                "index.feather": index,
                 "meta.json": params,
             }
         )
@@ -97,6 +199,10 @@ def load_system(data_dir: str, logs_to_artifact: bool = False):
         logging.info("Log artifacts and parameters to MLflow")
         mlflow.log_artifacts(cache.cache_dir, "")
         mlflow.log_params(params)
+        mlflow.log_params(
+            {param: checksums[name] for name, param in INPUT_FILES.items()}
+            | {IMPORT_VERSION_PARAM: IMPORT_VERSION}
+        )
 
 
 if __name__ == "__main__":
@@ -3,39 +3,38 @@ from typing import Sequence
 from parsing import SplcFmParser
 
 
+def _literal_to_id(literal: str, ids: dict, constraint: str) -> str:
+    name = literal[1:].strip() if literal.startswith("!") else literal
+    if name not in ids:
+        raise ValueError(f"Unknown feature '{name}' in constraint '{constraint}'")
+    return f"-{ids[name]}" if literal.startswith("!") else str(ids[name])
+
+
 def _constr_to_clauses(constraints, features):
-    final_constraints = []
+    ids = {feature: id_nr for id_nr, feature in features.items()}
+
+    # dict as ordered set, keeps the first occurrence of each clause
+    clauses = {}
     for constraint in constraints:
-        # bring constraint to dimacs format
-        constraint = constraint.replace("!", "-")
-        constraint = constraint.replace(" | ", " ")
-        constraint += " 0"
+        literals = [literal.strip() for literal in constraint.split("|")]
+        clause = [_literal_to_id(literal, ids, constraint) for literal in literals]
+        clauses.setdefault(" ".join(clause) + " 0", None)
 
-        # replace feature name with id
-        for id_nr, feature in features.items():
-            constraint = constraint.replace(feature, str(id_nr))
+    return list(clauses)
 
-        # identify mandatory features and add constraints for the combination of each one
-        # if constraint.count(" ") == 1:
-        #     mand = constraint.split(" ")[0]
-        #     final_constraints += [
-        #         f"{mand} -{str(id_nr)} 0"
-        #         for id_nr in features.keys()
-        #         if str(id_nr) != mand
-        #     ]
-        final_constraints.append(constraint)
 
-    return list(set(final_constraints))
+def _iter_dimacs(binary: Sequence, constraints: Sequence[str]):
+    features = {i + 1: binary[i] for i in range(len(binary))}
+    clauses = _constr_to_clauses(constraints, features)
 
+    for k, v in features.items():
+        yield f"c {str(k)} {v}"
+    yield f"p cnf {len(features)} {len(clauses)}"
+    yield from clauses
 
-def _generate_dimacs(binary: Sequence, constraints: Sequence[str]) -> str:
-    features = {i + 1: binary[i] for i in range(len(binary))}
 
-    lines = [f"c {str(k)} {v}" for k, v in features.items()]
-    clauses = _constr_to_clauses(constraints, features)
-    lines += [f"p cnf {len(lines)} {len(clauses)}"]
-    lines += clauses
-    return "\n".join(lines)
+def _generate_dimacs(binary: Sequence, constraints: Sequence[str]) -> str:
+    return "\n".join(_iter_dimacs(binary, constraints))
 
 
 class FeatureModel:
@@ -58,14 +57,26 @@ class FeatureModel:
     -------
     get_features():
         returns dict of binary and numeric features
+    write_dimacs(file):
+        writes dimacs representation line by line to an open file
     """
 
-    def __init__(self, xml_file: str):
-        self._parser = SplcFmParser()
+    def __init__(self, xml_file: str, validate: bool = True):
+        self._parser = SplcFmParser(validate)
         self.binary, self.numeric, self.constraints = self._parser.parse(xml_file)
-        self.dimacs = _generate_dimacs(self.binary, self.constraints)
         self.xml = self._parser.get_xml()
 
+    @property
+    def dimacs(self) -> str:
+        return _generate_dimacs(self.binary, self.constraints)
+
+    def write_dimacs(self, file):
+        """
+        Writes dimacs representation without building it in memory.
+        """
+        for line in _iter_dimacs(self.binary, self.constraints):
+            file.write(line + "\n")
+
     def get_features(self):
         """
         Return dictionary representation of features
@@ -1,27 +1,39 @@
+import os
 import logging
+import functools
 from abc import ABC, abstractmethod
 import xml.etree.ElementTree as ET
 
 import importlib.resources
 import xmlschema
 
-xsd_path_fm = "schema/schema_splc_fm.xsd"
-xsd_path_measure = "schema/schema_splc_meas.xsd"
+xsd_path_fm = os.path.join(os.path.dirname(__file__), "schema/schema_splc_fm.xsd")
+xsd_path_measure = os.path.join(
+    os.path.dirname(__file__), "schema/schema_splc_meas.xsd"
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_schema(xsd_path: str) -> xmlschema.XMLSchema:
+    """compiles a schema once per process"""
+    return xmlschema.XMLSchema(xsd_path)
 
 
 def _implication(option1, options):
     return [f"!{option1} | {opt}" for opt in options]
 
 
-def _exclusion(option1, options, optional=None):
+def _exclusion(option1, options, optional=None, parent=None):
     simple_exclusion = [f"!{option1} | !{opt}" for opt in options]
     if optional == "True":
         return simple_exclusion
-    return [" | ".join([option1] + options)] + simple_exclusion
+    # alternative group, one option is selected if the parent is
+    condition = [f"!{parent}"] if parent else []
+    return [" | ".join(condition + [option1] + options)] + simple_exclusion
 
 
-def _optional(option):
-    return [option]
+def _optional(option, parent=None):
+    return [f"!{parent} | {option}"] if parent else [option]
 
 
 class Parser(ABC):
@@ -31,9 +43,12 @@ class Parser(ABC):
     Attributes
     ----------
     schema : xmlschema.XMLSchema
-        the schema used by the instance.
+        the schema used by the instance, compiled on first use and shared
+        by all instances
     decoded_xml: dict
         the last decoded xml, returned from parsing with the schema
+    validate : bool
+        whether files are validated while decoding
     Methods
     -------
     get_xml():
@@ -42,16 +57,26 @@ class Parser(ABC):
         Abstract method implemented by subclasses
     """
 
-    schema: xmlschema.XMLSchema = None
+    xsd_path: str = None
     decoded_xml: dict = None
+    validate: bool = True
+
+    @property
+    def schema(self) -> xmlschema.XMLSchema:
+        return _load_schema(self.xsd_path)
+
+    @property
+    def _validation(self) -> str:
+        return "strict" if self.validate else "skip"
 
     def _validate_and_decode(self, xml_file: str):
         try:
-            self.schema.validate(xml_file)
+            self.decoded_xml = self.schema.decode(
+                xml_file, validation=self._validation
+            )
         except Exception:
             logging.error("The provided xml file is not valid vm format.")
             raise
-        self.decoded_xml = self.schema.decode(xml_file)
 
     def get_xml(self):
         """
@@ -90,8 +115,10 @@ class SplcFmParser(FmParser):
         Parses feature model and returns features and constraints.
     """
 
-    def __init__(self):
-        self.schema = xmlschema.XMLSchema(xsd_path_fm)
+    xsd_path = xsd_path_fm
+
+    def __init__(self, validate: bool = True):
+        self.validate = validate
 
     def _extract_binaries(self):
         binaries = []
@@ -99,17 +126,18 @@ class SplcFmParser(FmParser):
         binary_options = self.decoded_xml["binaryOptions"]["configurationOption"]
         for bo in binary_options:
             binaries.append(bo["name"])
+            parent = bo["parent"].strip() if bo["parent"] else None
             if bo["impliedOptions"]:
                 constraints += _implication(bo["name"], bo["impliedOptions"]["option"])
             if bo["excludedOptions"]:
                 constraints += _exclusion(
-                    bo["name"], bo["excludedOptions"]["option"], bo["optional"]
+                    bo["name"], bo["excludedOptions"]["option"], bo["optional"], parent
                 )
-            if bo["optional"] == "False":
-                constraints += _optional(bo["name"])
+            elif bo["optional"] == "False":
+                constraints += _optional(bo["name"], parent)
 
-            if bo["parent"]:
-                constraints += _implication(bo["name"], [bo["parent"]])
+            if parent:
+                constraints += _implication(bo["name"], [parent])
         return binaries, constraints
 
     def _extract_numerics(self):
@@ -154,24 +182,67 @@ class SplcMeasurementParser(MeasurementParser):
         Parses measurements and returns rows with data.
     """
 
-    def __init__(self):
-        self.schema = xmlschema.XMLSchema(xsd_path_measure)
+    xsd_path = xsd_path_measure
+
+    def __init__(self, validate: bool = True):
+        self.validate = validate
+
+    def _extract_row(self, row: dict):
+        config = {"nfp": {}}
+        for column in row["data"]:
+            if column["@column"] == "Configuration":
+                config["binaries"] = column["$"].replace("\n", "")
+            elif column["@column"] == "Variable Features":
+                config["numerics"] = column["$"].replace("\n", "")
+            else:
+                config["nfp"][column["@column"]] = column["$"].replace("\n", "")
+        return config
 
     def _extract_rows(self):
-        rows = []
-        for row in self.decoded_xml["row"]:
-            config = {"nfp": {}}
-            for column in row["data"]:
-                if column["@column"] == "Configuration":
-                    config["binaries"] = column["$"].replace("\n", "")
-                elif column["@column"] == "Variable Features":
-                    config["numerics"] = column["$"].replace("\n", "")
-                else:
-                    config["nfp"][column["@column"]] = column["$"].replace("\n", "")
-            rows.append(config)
-
-        return rows
+        return [self._extract_row(row) for row in self.decoded_xml["row"]]
 
     def parse(self, xml_file):
         self._validate_and_decode(xml_file)
         return self._extract_rows()
+
+    def iter_rows(self, xml_file: str):
+        """
+        Parses measurements incrementally and yields rows with data.
+        Every row is validated on its own, so the decoded document is never
+        held in memory.
+        """
+        row_schema = self.schema.find("results/row")
+        depth = 0
+        root = None
+        for event, element in ET.iterparse(xml_file, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if depth == 1:
+                    root = element
+                if (depth == 1 and element.tag != "results") or (
+                    depth == 2 and element.tag != "row"
+                ):
+                    logging.error("The provided xml file is not valid vm format.")
+                    raise xmlschema.XMLSchemaValidationError(
+                        self.schema, element, f"unexpected element {element.tag}"
+                    )
+                continue
+
+            depth -= 1
+            if depth == 1:
+                yield self._extract_row(self._decode_row(row_schema, element))
+                root.clear()
+
+    def _decode_row(self, row_schema, element):
+        if not self.validate:
+            return {
+                "data": [
+                    {"@column": data.get("column"), "$": data.text or ""}
+                    for data in element.iter("data")
+                ]
+            }
+        try:
+            return row_schema.decode(element)
+        except Exception:
+            logging.error("The provided xml file is not valid vm format.")
+            raise
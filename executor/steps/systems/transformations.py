@@ -1,6 +1,8 @@
 from typing import Sequence
+from array import array
 import logging
 
+import numpy as np
 import pandas as pd
 from parsing import SplcMeasurementParser
 
@@ -13,34 +15,27 @@ def _check_feature_existence(config: Sequence[str], features: Sequence[str]) ->
         )
 
 
-def _extract_numeric(measurement, numerics):
-    if "numerics" not in measurement:
-        return {}
-    transformed = {}
-    measurement = {
-        m.split(";")[0]: m.split(";")[1] for m in measurement["numerics"].split(",")
-    }
-
-    _check_feature_existence(measurement.keys(), numerics)
-    for numeric in numerics:
-        transformed[numeric] = (
-            float(measurement[numeric]) if numeric in measurement else None
-        )
-    return transformed
+def _encode_numeric(measurement, numeric_index):
+    """returns column indices and values of numeric options"""
+    values = {}
+    for option in measurement["numerics"].split(","):
+        name, _, value = option.partition(";")
+        values[name.strip()] = value
+    _check_feature_existence(values.keys(), numeric_index)
+    return [numeric_index[name] for name in values], [
+        float(value) for value in values.values()
+    ]
 
 
-def _extract_binary(measurement, binaries):
-    transformed = {}
+def _encode_binary(measurement, binary_index):
+    """returns column indices of selected binary options"""
     if measurement["binaries"] == "None":
-        for binary in binaries:
-            transformed[binary] = 0
-    else:
-        _check_feature_existence(
-            measurement["binaries"].strip(",").split(","), binaries
-        )
-        for binary in binaries:
-            transformed[binary] = 1 if binary in measurement["binaries"] else 0
-    return transformed
+        return []
+    tokens = [
+        token.strip() for token in measurement["binaries"].strip(",").split(",")
+    ]
+    _check_feature_existence(tokens, binary_index)
+    return [binary_index[token] for token in tokens]
 
 
 def _extract_nfp(measurement):
@@ -58,15 +53,46 @@ def _extract_nfp(measurement):
 
 
 def _measurements_to_df(measurements, binaries, numerics):
-    table = []
+    binary_index = {name: i for i, name in enumerate(binaries)}
+    numeric_index = {name: i for i, name in enumerate(numerics)}
+
+    binary_rows, binary_columns = array("q"), array("q")
+    numeric_rows, numeric_columns, numeric_values = array("q"), array("q"), array("d")
+    has_numerics = False
+    nfps = {}
+    n_rows = 0
     for measurement in measurements:
-        transformed = {}
-        transformed.update(_extract_binary(measurement, binaries))
-        transformed.update(_extract_numeric(measurement, numerics))
-        transformed.update(_extract_nfp(measurement))
-        table.append(transformed)
-
-    return pd.DataFrame(table)
+        columns = _encode_binary(measurement, binary_index)
+        binary_rows.extend([n_rows] * len(columns))
+        binary_columns.extend(columns)
+
+        if "numerics" in measurement:
+            has_numerics = True
+            columns, values = _encode_numeric(measurement, numeric_index)
+            numeric_rows.extend([n_rows] * len(columns))
+            numeric_columns.extend(columns)
+            numeric_values.extend(values)
+
+        for name, value in _extract_nfp(measurement).items():
+            nfps.setdefault(name, [None] * n_rows).append(value)
+        n_rows += 1
+        for values in nfps.values():
+            if len(values) < n_rows:
+                values.append(None)
+
+    binary_matrix = np.zeros((n_rows, len(binaries)), dtype=np.uint8)
+    binary_matrix[np.asarray(binary_rows), np.asarray(binary_columns)] = 1
+    frames = [pd.DataFrame(binary_matrix, columns=list(binaries))]
+
+    if has_numerics:
+        numeric_matrix = np.full((n_rows, len(numerics)), np.nan)
+        numeric_matrix[
+            np.asarray(numeric_rows), np.asarray(numeric_columns)
+        ] = np.asarray(numeric_values)
+        frames.append(pd.DataFrame(numeric_matrix, columns=list(numerics)))
+
+    frames.append(pd.DataFrame(nfps))
+    return pd.concat(frames, axis=1)
 
 
 class Measurements:
@@ -82,12 +108,28 @@ class Measurements:
         pandas representation of measurements
     xml : xml.etree.ElementTree
         xml representation of measurements
+    streaming : bool
+        whether rows are parsed incrementally. In this case, measurements and
+        xml are not kept in memory and are None.
     """
 
-    def __init__(self, filename: str, binary, numeric):
-        self._parser = SplcMeasurementParser()
-        self.measurements = self._parser.parse(filename)
-        df = _measurements_to_df(self.measurements, binary, numeric)
+    def __init__(
+        self,
+        filename: str,
+        binary,
+        numeric,
+        streaming: bool = True,
+        validate: bool = True,
+    ):
+        self._parser = SplcMeasurementParser(validate)
+        self.streaming = streaming
+        if streaming:
+            self.measurements = None
+            rows = self._parser.iter_rows(filename)
+        else:
+            self.measurements = self._parser.parse(filename)
+            rows = self.measurements
+        df = _measurements_to_df(rows, binary, numeric)
         nfps = list(set(df.columns) - set(binary) - set(numeric))
         self.df = df.rename(columns={nfp: "nfp_" + nfp for nfp in nfps})
-        self.xml = self._parser.get_xml()
+        self.xml = None if streaming else self._parser.get_xml()